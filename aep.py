@@ -0,0 +1,158 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+T = 8760  # total hours/year [h]
+
+def load_power_curves(power_curves_path):
+    # {name: DataFrame(ws, P, ct)} for every power curve csv, e.g. 'IEA-15MW-D240-H150'
+    return {file[:-4]: pd.read_csv(os.path.join(power_curves_path, file), encoding='utf-8-sig')
+            for file in sorted(os.listdir(power_curves_path)) if file.endswith('.csv')}
+
+def _as_curve_dict(power_curves):
+    return {'power_curve': power_curves} if isinstance(power_curves, pd.DataFrame) else dict(power_curves)
+
+def cut_in_out(power_curve_data):
+    producing = power_curve_data.loc[power_curve_data['P'] > 0, 'ws']
+    return producing.min(), producing.max()
+
+def power_curve_table(power_curves, ws_step=0.01):
+    # Power curves on one wind speed grid with trapezoid weights over [cut-in, cut-out] of each curve,
+    # so that integrating against any density is a single matrix product
+    power_curves = _as_curve_dict(power_curves)
+    cuts = np.array([cut_in_out(pc) for pc in power_curves.values()])
+    ws_start = cuts[:, 0].min()
+    n_grid = int(round((cuts[:, 1].max() - ws_start) / ws_step)) + 1
+    ws_grid = ws_start + ws_step * np.arange(n_grid)
+
+    weighted_power = np.zeros((n_grid, len(power_curves)))
+    for j, (pc, (cut_in, cut_out)) in enumerate(zip(power_curves.values(), cuts)):
+        i0 = int(round((cut_in - ws_start) / ws_step))
+        i1 = int(round((cut_out - ws_start) / ws_step))
+        weights = np.full(i1 - i0 + 1, ws_step)
+        weights[[0, -1]] = ws_step / 2
+        weighted_power[i0:i1 + 1, j] = weights * np.interp(ws_grid[i0:i1 + 1], pc['ws'], pc['P'])
+    return ws_grid, weighted_power, list(power_curves)
+
+def weibull_pdf(ws, shape, scale):
+    # (n_params, n_ws) densities for arrays of shape/scale pairs
+    shape = np.atleast_1d(np.asarray(shape, dtype=np.float64))[:, None]
+    scale = np.atleast_1d(np.asarray(scale, dtype=np.float64))[:, None]
+    x = ws[None, :] / scale
+    return (shape / scale) * x ** (shape - 1) * np.exp(-x ** shape)
+
+def calculate_aep_weibull(shape, scale, power_curves, ws_step=0.01, chunk_size=20000):
+    # Annual production of one turbine [kWh] for every (shape, scale) pair and every power curve
+    ws_grid, weighted_power, names = power_curve_table(power_curves, ws_step)
+    shape = np.atleast_1d(np.asarray(shape, dtype=np.float64))
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), shape.shape)
+
+    app = np.empty((len(shape), len(names)))
+    for start in range(0, len(shape), chunk_size):
+        stop = start + chunk_size
+        app[start:stop] = weibull_pdf(ws_grid, shape[start:stop], scale[start:stop]) @ weighted_power
+    app *= T
+    return {name: app[:, j] for j, name in enumerate(names)}
+
+def calculate_aep_histogram(windspeed_data, power_curves, bin_width=0.1):
+    # Same integration against the empirical wind speed histogram instead of a Weibull fit
+    power_curves = _as_curve_dict(power_curves)
+    windspeed_data = np.asarray(windspeed_data, dtype=np.float64)
+    windspeed_data = windspeed_data[np.isfinite(windspeed_data)]
+    edges = np.arange(0, windspeed_data.max() + 2 * bin_width, bin_width)
+    counts, _ = np.histogram(windspeed_data, bins=edges)
+    centres = (edges[:-1] + edges[1:]) / 2
+    frequency = counts / counts.sum()
+
+    results = {}
+    for name, pc in power_curves.items():
+        cut_in, cut_out = cut_in_out(pc)
+        power = np.where((centres >= cut_in) & (centres <= cut_out), np.interp(centres, pc['ws'], pc['P']), 0.0)
+        results[name] = T * frequency @ power
+    return results
+
+def calculate_app(shape, scale, power_curve_data, ws_step=0.01):
+    # Drop-in for the quad based APP: (APP, error estimate) from grid steps h and 2h
+    app = calculate_aep_weibull(shape, scale, power_curve_data, ws_step)['power_curve'][0]
+    app_coarse = calculate_aep_weibull(shape, scale, power_curve_data, 2 * ws_step)['power_curve'][0]
+    return app, abs(app - app_coarse)
+
+def benchmark_aep(windspeed_data, power_curve_data, n_params=1000, n_quad=20):
+    from data_analysis import calculate_aep
+
+    start = time.perf_counter()
+    reference = calculate_aep(windspeed_data, power_curve_data, 1, 1, 1)
+    time_reference = time.perf_counter() - start
+    shape, scale = reference['shape'], reference['scale']
+
+    start = time.perf_counter()
+    app_table, _ = calculate_app(shape, scale, power_curve_data)
+    time_table = time.perf_counter() - start
+    rel_diff = abs(app_table / 1e6 - reference['APP_one_turbine']) / reference['APP_one_turbine']
+
+    # Sensitivity study: many (shape, scale) pairs, quad timed on a subset and extrapolated
+    rng = np.random.default_rng(42)
+    shapes = shape * rng.uniform(0.8, 1.2, n_params)
+    scales = scale * rng.uniform(0.8, 1.2, n_params)
+    start = time.perf_counter()
+    app_batch = calculate_aep_weibull(shapes, scales, power_curve_data)['power_curve']
+    time_batch = time.perf_counter() - start
+
+    from scipy.integrate import quad
+    from scipy.interpolate import interp1d
+    from scipy.stats import weibull_min
+    power_curve_func = interp1d(power_curve_data['ws'], power_curve_data['P'], fill_value="extrapolate")
+    cut_in, cut_out = cut_in_out(power_curve_data)
+    start = time.perf_counter()
+    app_quad = np.array([quad(lambda ws: power_curve_func(ws) * weibull_min.pdf(ws, k, loc=0, scale=a),
+                              cut_in, cut_out, limit=100, epsabs=1e-05, epsrel=1e-05)[0] * T
+                         for k, a in zip(shapes[:n_quad], scales[:n_quad])])
+    time_quad = (time.perf_counter() - start) * n_params / n_quad
+    batch_rel_diff = np.max(np.abs(app_batch[:n_quad] - app_quad) / app_quad)
+
+    print(f'calculate_aep (fit + quad): {time_reference:.3f} s, table engine: {time_table * 1e3:.2f} ms, '
+          f'relative difference {rel_diff:.2e}')
+    print(f'{n_params} (shape, scale) pairs: quad ~{time_quad:.2f} s, table engine {time_batch * 1e3:.2f} ms, '
+          f'max. relative difference {batch_rel_diff:.2e}')
+
+    return {
+        'time_calculate_aep': time_reference,
+        'time_table': time_table,
+        'relative_difference': rel_diff,
+        'time_quad_batch': time_quad,
+        'time_table_batch': time_batch,
+        'batch_relative_difference': batch_rel_diff,
+    }
+
+def calculate_sector_aep(windspeed, winddirection, power_curves, n_sectors=12, ws_bin=0.5):
+    # Direction-binned Weibull fits from one wind rose histogram, AEP for all power curves at once
+    from wind_rose import wind_rose_table
+    from weibull import fit_weibull_histogram
+
+    power_curves = _as_curve_dict(power_curves)
+    table = wind_rose_table(windspeed, winddirection, n_sectors=n_sectors, ws_bin=ws_bin)
+    counts = table['counts']
+    fit = fit_weibull_histogram(counts, table['ws_centres'])
+    frequency = counts.sum(axis=1) / counts.sum()
+
+    fitted = np.isfinite(fit['shape'])
+    app_sector = calculate_aep_weibull(fit['shape'][fitted], fit['scale'][fitted], power_curves)
+
+    sectors = pd.DataFrame({
+        'frequency': frequency,
+        'shape': fit['shape'],
+        'scale': fit['scale'],
+    }, index=pd.Index(table['wd_centres'], name='sector'))
+    app = {}
+    for name, values in app_sector.items():
+        sectors[f'APP {name}'] = 0.0
+        sectors.loc[fitted, f'APP {name}'] = values
+        app[name] = float(sectors['frequency'] @ sectors[f'APP {name}'])
+
+    return {'APP': app, 'sectors': sectors, 'table': table}
+
+def print_sector_aep(results, n_turbines=366):
+    print(results['sectors'][['frequency', 'shape', 'scale']].round(3))
+    for name, app in results['APP'].items():
+        print(f"{name}: APP of one turbine {app / 1e6:.4f} GWh, {n_turbines} turbines {(app / 1e9) * n_turbines:.4f} TWh")
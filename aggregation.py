@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from circular import is_direction_column, vector_direction
+
+# Calendar resolutions and the axes of the (year, month, hour) cube they sum over
+RESOLUTIONS = {
+    'year': (1, 2),
+    'month': (0, 2),
+    'hour': (0, 1),
+    'month_hour': (0,),
+    'year_month': (2,),
+}
+LEVELS = {
+    'year': ['year'],
+    'month': ['month'],
+    'hour': ['hour'],
+    'month_hour': ['month', 'hour'],
+    'year_month': ['year', 'month'],
+}
+
+def calendar_keys(times):
+    # Integer year, month (1-12) and hour (0-23) straight from datetime64, without DatetimeIndex accessors
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_localize(None)  # local wall time, as DatetimeIndex.hour
+    t = times.values.astype('datetime64[ns]')
+    months = t.astype('datetime64[M]').astype(np.int64)
+    hours = (t - t.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1, hours
+
+def _cube_sums(values, cells, n_cells):
+    # NaN-aware sums and counts of every column on the flat (year, month, hour) grid
+    valid = np.isfinite(values)
+    sums = np.empty((n_cells, values.shape[1]))
+    counts = np.empty((n_cells, values.shape[1]))
+    for j in range(values.shape[1]):
+        sums[:, j] = np.bincount(cells, weights=np.where(valid[:, j], values[:, j], 0.0), minlength=n_cells)
+        counts[:, j] = np.bincount(cells, weights=valid[:, j], minlength=n_cells)
+    return sums, counts
+
+def _empty_result(resolution, columns):
+    levels = LEVELS[resolution]
+    if len(levels) > 1:
+        index = pd.MultiIndex.from_arrays([np.empty(0, dtype=np.int64)] * len(levels), names=levels)
+    else:
+        index = pd.Index(np.empty(0, dtype=np.int64), name=levels[0])
+    return pd.DataFrame({c: np.empty(0) for c in columns}, index=index)
+
+def aggregate(df, resolutions=('month',), columns=None, time=None):
+    # Means per calendar resolution ('year', 'month', 'hour', 'month_hour', 'year_month') from one scan of the
+    # data: every column is binned once onto the (year, month, hour) grid, each resolution is a sum over that
+    # small grid. Direction columns are averaged as vectors. The caller's frame is not modified.
+    # time: column with the time stamps, the index by default
+    for resolution in resolutions:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'Unknown resolution {resolution!r}, choose from {list(RESOLUTIONS)}')
+    if columns is None:
+        columns = list(df.select_dtypes(include=['number', 'bool']).columns)
+        if time is not None and time in columns:
+            columns.remove(time)
+    columns = list(columns)
+
+    times = pd.DatetimeIndex(df.index if time is None else df[time])
+    timed = ~np.asarray(times.isna())  # like groupby, rows without a time stamp are dropped
+    if not timed.any():
+        return {resolution: _empty_result(resolution, columns) for resolution in resolutions}
+    year, month, hour = calendar_keys(times[timed])
+    year_min = year.min()
+    n_years = int(year.max() - year_min) + 1
+    cells = ((year - year_min) * 12 + month - 1) * 24 + hour
+    n_cells = n_years * 12 * 24
+
+    # Linear columns as values, direction columns as sin and cos
+    directions = [c for c in columns if is_direction_column(c)]
+    linear = [c for c in columns if c not in directions]
+    parts = [df[linear].to_numpy(dtype=np.float64)[timed]] if linear else []
+    if directions:
+        rad = np.radians(df[directions].to_numpy(dtype=np.float64)[timed])
+        parts += [np.sin(rad), np.cos(rad)]
+    values = np.hstack(parts) if parts else np.empty((len(cells), 0))
+
+    sums, counts = _cube_sums(values, cells, n_cells)
+    rows = np.bincount(cells, minlength=n_cells)
+    shape = (n_years, 12, 24)
+    sums = sums.reshape(shape + (values.shape[1],))
+    counts = counts.reshape(shape + (values.shape[1],))
+    rows = rows.reshape(shape)
+
+    n_lin, n_dir = len(linear), len(directions)
+    results = {}
+    for resolution in resolutions:
+        axes = RESOLUTIONS[resolution]
+        s = sums.sum(axis=axes)
+        n = counts.sum(axis=axes)
+        present = rows.sum(axis=axes) > 0  # like groupby: only groups with rows
+        levels = LEVELS[resolution]
+        grid = [np.arange(year_min, year_min + n_years), np.arange(1, 13), np.arange(24)]
+        kept = [grid[i] for i in range(3) if i not in axes]
+        index = pd.MultiIndex.from_product(kept, names=levels)[present.ravel()]
+        s = s.reshape(-1, values.shape[1])[present.ravel()]
+        n = n.reshape(-1, values.shape[1])[present.ravel()]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data = {c: s[:, j] / n[:, j] for j, c in enumerate(linear)}
+        for j, c in enumerate(directions):
+            data[c] = np.where(n[:, n_lin + j] > 0, vector_direction(s[:, n_lin + j], s[:, n_lin + n_dir + j]), np.nan)
+        result = pd.DataFrame({c: data[c] for c in columns}, index=index)
+        if len(levels) == 1:
+            result.index = result.index.get_level_values(0)
+        results[resolution] = result
+    return results
+
+def month_hour_table(results, column):
+    # 12 x 24 heatmap of one column from aggregate(..., resolutions=['month_hour'])
+    return results['month_hour'][column].unstack('hour')
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+def time_bins(index, freq='10min', round_to_bin=True):
+    # Integer bin number of every time stamp, relative to the first bin
+    index = pd.DatetimeIndex(index)
+    if round_to_bin:
+        index = index.floor('s').round(freq)
+    step = pd.Timedelta(freq).value
+    t = index.values.astype('datetime64[ns]').view(np.int64)
+    origin = t.min() - t.min() % step if round_to_bin else t.min()
+    return (t - origin) // step, origin, step
+
+def _bin_starts(sorted_bins):
+    return np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+
+def gap_table(available_bins, n_first, n_last, origin, step):
+    # Runs of missing bins between n_first and n_last, given the sorted available bins
+    edges = np.r_[n_first - 1, available_bins, n_last + 1]
+    jumps = np.flatnonzero(np.diff(edges) > 1)
+    first_missing = edges[jumps] + 1
+    last_missing = edges[jumps + 1] - 1
+    n_missing = last_missing - first_missing + 1
+
+    return pd.DataFrame({
+        'start': pd.to_datetime(origin + first_missing * step),
+        'end': pd.to_datetime(origin + last_missing * step),
+        'duration': pd.to_timedelta(n_missing * step),
+        'n_missing': n_missing,
+    })
+
+def analyze_availability(dataframe, freq='10min', columns=None, round_to_bin=True):
+    # Availability, gap runs and per-column coverage without reindexing onto the full time grid
+    columns = list(dataframe.columns) if columns is None else list(columns)
+    bins, origin, step = time_bins(dataframe.index, freq, round_to_bin)
+    valid = dataframe[columns].notna().to_numpy()
+
+    if len(bins) and np.any(bins[1:] < bins[:-1]):
+        order = np.argsort(bins, kind='stable')
+        bins, valid = bins[order], valid[order]
+
+    if len(bins) == 0:
+        empty = gap_table(np.empty(0, dtype=np.int64), 0, -1, 0, step)
+        return {'expected': 0, 'actual': 0, 'availability': 0.0, 'gaps': empty,
+                'coverage': pd.Series(0.0, index=columns), 'freq': freq}
+
+    # A bin counts as available when at least one of its rows is complete, as the row-wise
+    # isnull().any(axis=1) check did; coverage counts a column in a bin when any row has it
+    starts = _bin_starts(bins)
+    unique_bins = bins[starts]
+    bin_valid = np.logical_or.reduceat(valid, starts, axis=0)
+    bin_complete = np.logical_or.reduceat(valid.all(axis=1), starts)
+
+    n_first, n_last = unique_bins[0], unique_bins[-1]
+    total_expected = int(n_last - n_first + 1)
+    total_actual = int(bin_complete.sum())
+    gaps = gap_table(unique_bins[bin_complete], n_first, n_last, origin, step)
+    coverage = pd.Series(100 * bin_valid.sum(axis=0) / total_expected, index=columns)
+
+    return {
+        'expected': total_expected,
+        'actual': total_actual,
+        'availability': 100 * total_actual / total_expected,
+        'gaps': gaps,
+        'coverage': coverage,
+        'freq': freq,
+    }
+
+def print_availability(result, data_name=None):
+    label = '' if data_name is None else f' of the {data_name} data'
+    print(f"Data Availability{label} is {result['availability']:.2f}%")
+    if not result['gaps'].empty:
+        print(f"Missing time periods are ({len(result['gaps'])} gaps, {result['gaps']['n_missing'].sum()} missing steps):")
+        print(result['gaps'])
+    else:
+        print('No data gaps are found.')
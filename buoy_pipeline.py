@@ -0,0 +1,86 @@
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+import data_loading
+import data_analysis
+from availability import analyze_availability
+
+def find_lidar_group(buoy_file):
+    # Prefer the measured lidar group over the *_MCP reconstructed one
+    candidates = [name for name, group in buoy_file.groups.items() if 'wind_speed' in group.variables]
+    measured = [name for name in candidates if not name.endswith('_MCP')]
+    if not candidates:
+        raise ValueError(f'No group with a wind_speed variable in {buoy_file.filepath()}')
+    return (measured or candidates)[0]
+
+def resolve_sources(sources):
+    # Accepts paths or dicts {'path', 'group', 'name'}; returns a list of dicts in input order
+    resolved = []
+    for source in sources:
+        source = {'path': source} if isinstance(source, str) else dict(source)
+        if source.get('group') is None:
+            with data_loading.open_buoy(source['path']) as nc:
+                source['group'] = find_lidar_group(nc)
+        source.setdefault('name', f"{os.path.splitext(os.path.basename(source['path']))[0]}:{source['group']}")
+        resolved.append(source)
+
+    names = [source['name'] for source in resolved]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Buoy names are not unique: {names}')
+    return resolved
+
+def align_to_grid(dataframe, freq='10min'):
+    # Same time alignment as data_analysis.check_data_gaps, without modifying the input
+    dataframe = dataframe.copy()
+    dataframe.index = dataframe.index.floor('s').round(freq)
+    return dataframe
+
+def process_buoy(source, levels=data_loading.BUOY_LEVELS, freq='10min', select_1yr=False, chunk_size=None):
+    # open -> level extraction -> gap check -> dedupe -> fill, for one buoy
+    df_buoy = data_loading.load_buoy_dataframe(source['path'], source['group'], levels, chunk_size=chunk_size)
+    df_buoy = align_to_grid(df_buoy, freq)
+    result = analyze_availability(df_buoy, freq, round_to_bin=False)
+    stats = {
+        'start': df_buoy.index.min(),
+        'end': df_buoy.index.max(),
+        'expected': result['expected'],
+        'actual': result['actual'],
+        'availability': result['availability'],
+        'n_gaps': len(result['gaps']),
+        'longest_gap': result['gaps']['duration'].max() if len(result['gaps']) else pd.Timedelta(0),
+    }
+
+    df_buoy, dedupe_stats, _ = data_analysis.deduplicate(df_buoy, key='time')
+    stats['duplicates'] = dedupe_stats['n_dropped']
+
+    if select_1yr:
+        df_buoy = data_analysis.replace_nan_and_select_1yr(df_buoy)
+    else:
+        df_buoy = df_buoy.ffill()
+    return source['name'], df_buoy, stats
+
+def _process_buoy_args(args):
+    return process_buoy(*args)
+
+def run_buoy_pipeline(sources, levels=data_loading.BUOY_LEVELS, n_workers=None, freq='10min',
+                      select_1yr=False, chunk_size=None):
+    # Combined frame with (buoy, variable) columns on the union of all time stamps
+    sources = resolve_sources(sources)
+    tasks = [(source, levels, freq, select_1yr, chunk_size) for source in sources]
+
+    if n_workers == 1 or len(tasks) <= 1:
+        results = [_process_buoy_args(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # map keeps the input order, independent of which worker finishes first
+            results = list(executor.map(_process_buoy_args, tasks))
+
+    buoy_dfs = {name: df_buoy for name, df_buoy, _ in results}
+    combined = pd.concat(buoy_dfs, axis=1, join='outer', sort=True)
+    combined.columns.names = ['buoy', 'variable']
+    combined.index.name = 'time'
+
+    stats = pd.DataFrame({name: buoy_stats for name, _, buoy_stats in results}).T
+    stats.index.name = 'buoy'
+    return combined, stats
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Directions in degrees [0, 360), meteorological convention. NaNs are ignored by every reduction.
+
+def is_direction_column(name):
+    # 'WD100', 'era5_WD100', 'meas_WD150', 'long-term_WD150', 'wd6_150m', 'wind_direction_140m'
+    name = str(name)
+    return 'WD' in name or name.startswith('wd') or 'wind_direction' in name
+
+def direction_columns(columns):
+    return [column for column in columns if is_direction_column(column)]
+
+def wrap_difference(a, b):
+    # Signed shortest angle a - b in [-180, 180)
+    return (np.asarray(a) - np.asarray(b) + 180) % 360 - 180
+
+def _sin_cos(deg):
+    rad = np.radians(np.asarray(deg, dtype=np.float64))
+    return np.sin(rad), np.cos(rad)
+
+def vector_direction(sin_sum, cos_sum):
+    # the second mod maps -0.0 (rounded to 360.0 by the first) back to 0
+    return np.mod(np.mod(np.degrees(np.arctan2(sin_sum, cos_sum)), 360), 360)
+
+def circular_mean(deg, axis=None, weights=None):
+    # Direction of the (weighted) mean unit vector
+    s, c = _sin_cos(deg)
+    valid = np.isfinite(s)
+    w = valid if weights is None else np.where(valid, weights, 0.0)
+    return vector_direction(np.sum(np.where(valid, s, 0) * w, axis=axis), np.sum(np.where(valid, c, 0) * w, axis=axis))
+
+def resultant_length(deg, axis=None):
+    # Length of the mean unit vector, 1 for constant directions, 0 for uniformly spread ones
+    s, c = _sin_cos(deg)
+    return np.hypot(np.nanmean(s, axis=axis), np.nanmean(c, axis=axis))
+
+def circular_std(deg, axis=None):
+    # sqrt(-2 ln R) in degrees
+    r = np.clip(resultant_length(deg, axis), 1e-300, 1)
+    return np.degrees(np.sqrt(2 * np.log(1 / r)))
+
+def sector_width(n_sectors):
+    return 360 / n_sectors
+
+def sector_centres(n_sectors):
+    return np.arange(n_sectors) * sector_width(n_sectors)
+
+def sector_index(wd, n_sectors=12):
+    # Sectors are centred on their direction, i.e. sector 0 covers [-width/2, width/2) around north
+    width = sector_width(n_sectors)
+    return (np.mod(np.asarray(wd, dtype=np.float64) + width / 2, 360) // width).astype(np.int64) % n_sectors
+
+def grouped_circular_stats(deg, groups, n_groups=None, weights=None):
+    # Circular mean, std and count per integer group code in three bincount passes; codes < 0 are skipped
+    s, c = _sin_cos(deg)
+    groups = np.asarray(groups, dtype=np.int64)
+    valid = np.isfinite(s) & (groups >= 0)
+    w = valid.astype(np.float64) if weights is None else np.where(valid, weights, 0.0)
+    groups = np.where(valid, groups, 0)
+    n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+    sin_sum = np.bincount(groups, weights=np.where(valid, s, 0) * w, minlength=n_groups)
+    cos_sum = np.bincount(groups, weights=np.where(valid, c, 0) * w, minlength=n_groups)
+    count = np.bincount(groups, weights=w, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.clip(np.hypot(sin_sum, cos_sum) / count, 1e-300, 1)
+        std = np.degrees(np.sqrt(2 * np.log(1 / r)))
+    empty = count == 0
+    mean = np.where(empty, np.nan, vector_direction(sin_sum, cos_sum))
+    return {'mean': mean, 'std': np.where(empty, np.nan, std), 'count': count}
+
+def grouped_circular_mean(deg, groups, n_groups=None, weights=None):
+    return grouped_circular_stats(deg, groups, n_groups, weights)['mean']
+
+def resample_mean(df, freq):
+    # df.resample(freq).mean() with the direction columns averaged as vectors
+    result = df.resample(freq).mean()
+    for column in direction_columns(result.columns):
+        s, c = _sin_cos(df[column])
+        sin_mean = pd.Series(s, index=df.index).resample(freq).mean()
+        cos_mean = pd.Series(c, index=df.index).resample(freq).mean()
+        result[column] = vector_direction(sin_mean, cos_mean).where(sin_mean.notna())
+    return result
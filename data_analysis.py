@@ -1,39 +1,73 @@
 import pandas as pd
 import numpy as np
 
+from circular import circular_mean, circular_std
+from aggregation import aggregate
+
 def check_data_gaps(dataframe):
+    from availability import analyze_availability, print_availability
     
     dataframe.index = dataframe.index.floor('s')  # Truncate microseconds
 
     # Round timestamps to the nearest 10 minutes
     dataframe.index = dataframe.index.round('10min')
     
-    # Generate a complete time range based on the data frequency
-    full_time_range = pd.date_range(start=dataframe.index.min(), end=dataframe.index.max(), freq='10min')
-    dataframe = dataframe.reindex(full_time_range)
-    
-    missing_data = dataframe[dataframe.isnull().any(axis=1)]
-    
-    total_expected = len(full_time_range)
-    total_actual = len(dataframe.dropna())
-    availability = (total_actual / total_expected) * 100
-    
-    print(f"Data Availability is {availability:.2f}%")
-    
-    if not missing_data.empty:
-        print("Missing time periods are:")
-        print(missing_data.index)
-    else:
-        print("No data gaps are found.")
-    
-    return missing_data
+    # Availability and gap runs on integer 10-minute bins, without reindexing the frame
+    result = analyze_availability(dataframe, freq='10min', round_to_bin=False)
+    print_availability(result)
+    
+    return result['gaps']
+
+def hash_keys(dataframe, key='rows'):
+    # One uint64 per row: hashed row values ('rows'), values plus time stamp ('both') or the time stamp itself ('time')
+    if key == 'time':
+        return pd.DatetimeIndex(dataframe.index).values.astype('datetime64[ns]').view(np.uint64)
+    if key not in ('rows', 'both'):
+        raise ValueError(f"key must be 'rows', 'time' or 'both', got {key!r}")
+    return pd.util.hash_pandas_object(dataframe, index=(key == 'both')).to_numpy()
+
+def deduplicate(dataframe, key='rows', state=None):
+    # Single pass over the row hashes. Pass the returned state with the next appended chunk
+    # to drop rows already seen in earlier chunks without re-hashing the history.
+    if state is not None and state['key'] != key:
+        raise ValueError(f"state was built with key={state['key']!r}, got key={key!r}")
+    hashes = hash_keys(dataframe, key)
+    seen = np.empty(0, dtype=np.uint64) if state is None else state['hashes']
+
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]])
+    group_sizes = np.diff(np.r_[starts, len(hashes)])
+    unique_hashes = sorted_hashes[starts]
+
+    pos = np.searchsorted(seen, unique_hashes)
+    in_history = (pos < len(seen)) & (seen[np.minimum(pos, len(seen) - 1)] == unique_hashes) if len(seen) else \
+        np.zeros(len(unique_hashes), dtype=bool)
+
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[order[starts[~in_history]]] = True
+    duplicated_all = np.zeros(len(hashes), dtype=bool)
+    duplicated_all[order] = np.repeat((group_sizes > 1) | in_history, group_sizes)
+
+    new_hashes = unique_hashes[~in_history]
+    state = {
+        'key': key,
+        'hashes': np.insert(seen, np.searchsorted(seen, new_hashes), new_hashes),
+        'n_rows': (0 if state is None else state['n_rows']) + len(hashes),
+    }
+    stats = {
+        'n_rows': len(hashes),
+        'n_kept': int(keep.sum()),
+        'n_dropped': int(len(hashes) - keep.sum()),
+        'n_duplicate_groups': int((group_sizes > 1).sum()),
+        'max_group_size': int(group_sizes.max()) if len(group_sizes) else 0,
+        'n_history_matches': int(group_sizes[in_history].sum()),
+        'duplicated': duplicated_all,
+    }
+    return dataframe[keep], stats, state
 
-def drop_duplicates(dataframe):
-    # Identify duplicate rows
-    duplicates = dataframe[dataframe.duplicated(keep=False)]
-    
-    # Drop duplicates
-    no_duplicate_data = dataframe.drop_duplicates()
+def print_duplicates(dataframe, no_duplicate_data, stats):
+    duplicates = dataframe[stats['duplicated']]
     
     # Calculate data availability
     total_expected = len(dataframe)
@@ -51,9 +85,16 @@ def drop_duplicates(dataframe):
     
     return duplicates
 
+def drop_duplicates(dataframe):
+    # Identify and drop duplicate rows in one hashing pass
+    no_duplicate_data, stats, _ = deduplicate(dataframe, key='rows')
+    return print_duplicates(dataframe, no_duplicate_data, stats)
+
 def explore_and_prefilter_df(dataframe):
    check_data_gaps(dataframe)
-   drop_duplicates(dataframe)
+   no_duplicate_data, stats, _ = deduplicate(dataframe, key='rows')
+   print_duplicates(dataframe, no_duplicate_data, stats)
+   return no_duplicate_data
    
 def replace_nan_and_select_1yr(dataframe):
     #dataframe = dataframe.fillna(dataframe.mean())
@@ -62,34 +103,24 @@ def replace_nan_and_select_1yr(dataframe):
     return dataframe
 
 def group_month_and_calc_mean(df):
-    df.index = pd.to_datetime(df.index)
-    df['month'] = df.index.month
-    df_month_mean = df.groupby('month').mean()
-    return df_month_mean
+    return aggregate(df, ['month'])['month']
 
 def group_month_and_calc_mean_year(df):
-    df = df.copy()  # Ensure working with a copy of the DataFrame
-    df.index = pd.to_datetime(df.index)
-    df.loc[:, 'year'] = df.index.year  # Use .loc to avoid the SettingWithCopyWarning
-    df_month_mean = df.groupby('year').mean()
-    return df_month_mean
+    return aggregate(df, ['year'])['year']
 
 # Calculate yearly statistics for wind speed
 def calc_yearly_statistics(windspeed, winddirection):
     yearly_mean_ws = np.mean(windspeed)
     yearly_std_ws = np.std(windspeed)
-    yearly_mean_wd = np.mean(winddirection)
-    yearly_std_wd = np.std(winddirection)
+    yearly_mean_wd = circular_mean(winddirection)
+    yearly_std_wd = circular_std(winddirection)
     print(f"Yearly Mean of Wind Speed: {yearly_mean_ws:.2f}, Standard Deviation: {yearly_std_ws:.2f}")
     print(f"Yearly Mean of Wind Direction: {yearly_mean_wd:.2f}, Standard Deviation: {yearly_std_wd:.2f}")
     
 def calc_diurnal_wsand_wd(df):
-        df.index = pd.to_datetime(df.index)
-        df['hour'] = df.index.hour
-        df_diurnal_WSWD = df.groupby('hour').mean()
-        return df_diurnal_WSWD
+        return aggregate(df, ['hour'])['hour']
     
-def calculate_aep(windspeed_data, power_curve_data, turbines_N9_1, turbines_N9_2, turbines_N9_3):
+def calculate_aep(windspeed_data, power_curve_data, turbines_N9_1, turbines_N9_2, turbines_N9_3, method='quad', fit_method='scipy'):
     # Constants
     T = 8760  # total hours/year [h]
     rho = 1.225  # air density [kg/m^3]
@@ -129,10 +160,21 @@ def calculate_aep(windspeed_data, power_curve_data, turbines_N9_1, turbines_N9_2
     cut_in_ws = cut_in_windspeed(power_curve_data)
     cut_out_ws = cut_out_windspeed(power_curve_data)
     power_curve_func = power_curve_interpolated(power_curve_data)
-    shape, scale = calculate_weibull_fit(windspeed_data)
+    if fit_method == 'scipy':
+        shape, scale = calculate_weibull_fit(windspeed_data)
+    else:
+        # Closed-form / binned fits, see weibull.py
+        from weibull import fit_weibull
+        fit = fit_weibull(windspeed_data, method=fit_method)
+        shape, scale = fit['shape'][0], fit['scale'][0]
 
     # Calculate APP (Annual Power Production)
-    APP, error = calculate_APP(shape, scale, power_curve_func, cut_in_ws, cut_out_ws)
+    if method == 'table':
+        # Vectorized grid integration, see aep.py
+        from aep import calculate_app
+        APP, error = calculate_app(shape, scale, power_curve_data)
+    else:
+        APP, error = calculate_APP(shape, scale, power_curve_func, cut_in_ws, cut_out_ws)
     
     results = {
         "APP_one_turbine": APP / 1e6,
@@ -1,3 +1,4 @@
+import numpy as np
 import xarray as xr
 from netCDF4 import Dataset
 
@@ -45,4 +46,70 @@ def read_LT_data_to_df(filepath):
     import pandas as pd
     df = pd.read_csv(filepath)
     df.set_index('time', inplace=True)
-    return df
\ No newline at end of file
+    return df
+
+BUOY_LEVELS = {140: 3, 200: 4}  # height [m]: index on the lidar height dimension
+
+def open_buoy(path):
+    return Dataset(path)
+
+def get_group(buoy_file, group_name):
+    # Group names can be nested, e.g. 'ZX_LIDAR_WLBZ_6' or 'ZX_LIDAR_WLBZ_6/subgroup'
+    group = buoy_file
+    for name in group_name.strip('/').split('/'):
+        group = group.groups[name]
+    return group
+
+def decode_time(time_var):
+    import pandas as pd
+    values = time_var[:]
+    values = np.ma.filled(values.astype(np.float64), np.nan) if np.ma.isMaskedArray(values) else values
+    units = getattr(time_var, 'units', '')
+    calendar = getattr(time_var, 'calendar', 'standard')
+    if ' since ' in units and calendar in ('standard', 'gregorian', 'proleptic_gregorian'):
+        unit, reference = units.split(' since ')
+        reference = pd.Timestamp(reference.strip())
+        if reference.tzinfo is not None:
+            reference = reference.tz_convert(None)
+        unit = {'seconds': 's', 'minutes': 'min', 'hours': 'h', 'days': 'D'}.get(unit.strip(), unit.strip())
+        return reference + pd.to_timedelta(values, unit=unit)
+    from netCDF4 import num2date
+    times = num2date(values, units, calendar, only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+    return pd.DatetimeIndex(times)
+
+def read_buoy_levels(buoy_file, group_name, height_indices, variables=('wind_speed', 'wind_from_direction'),
+                     time_name='time', chunk_size=None):
+    # Hyperslab reads of the selected height indices only, [time, ..., height] -> (time, n_levels) float32
+    if isinstance(buoy_file, str):
+        with open_buoy(buoy_file) as nc:
+            return read_buoy_levels(nc, group_name, height_indices, variables, time_name, chunk_size)
+
+    group = get_group(buoy_file, group_name)
+    time_var = buoy_file.variables[time_name] if time_name in buoy_file.variables else group.variables[time_name]
+    height_indices = list(height_indices)
+
+    data = {'time': decode_time(time_var)}
+    for name in variables:
+        var = group.variables[name]
+        n_time = var.shape[0]
+        step = n_time if not chunk_size else chunk_size
+        fixed = (0,) * (var.ndim - 2)
+        out = np.empty((n_time, len(height_indices)), dtype=np.float32)
+        for start in range(0, n_time, step):
+            stop = min(start + step, n_time)
+            block = var[(slice(start, stop),) + fixed + (height_indices,)]
+            out[start:stop] = np.ma.filled(np.ma.asarray(block, dtype=np.float32), np.nan)
+        data[name] = out
+    return data
+
+def load_buoy_dataframe(buoy_file, group_name, levels=BUOY_LEVELS, chunk_size=None):
+    import pandas as pd
+    heights = list(levels)
+    data = read_buoy_levels(buoy_file, group_name, levels.values(), chunk_size=chunk_size)
+
+    columns = {}
+    for i, height in enumerate(heights):
+        columns[f'wind_speed_{height}m'] = data['wind_speed'][:, i]
+        columns[f'wind_direction_{height}m'] = data['wind_from_direction'][:, i]
+    df_buoy = pd.DataFrame(columns, index=pd.DatetimeIndex(data['time'], name='time'))
+    return df_buoy
@@ -4,7 +4,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 from windrose import WindroseAxes
 
-def load_era5_data(path, start_year, end_year):
+from circular import circular_mean, resample_mean
+from aggregation import aggregate
+
+def load_era5_data(path, start_year, end_year, store_path=None):
+    if store_path is not None:
+        # Columnar store, (re-)ingested from the csv files when they changed
+        from era5_store import load_era5_store
+        return load_era5_store(path, store_path, start_year, end_year)
+
     all_files = [f for f in os.listdir(path) if f.startswith('ERA5_N-9_') and f.endswith('.csv')]
     all_files.sort()
     era5_data_list = [pd.read_csv(os.path.join(path, file)) for file in all_files 
@@ -23,28 +31,19 @@ def process_era5_data(era5_data):
 
 def calculate_averages(era5_data):
     overall_avg = era5_data[['WS100', 'WS10']].mean()
-    yearly_avg = era5_data.groupby('year')[['WS100', 'WS10']].mean()
-    monthly_avg = era5_data.groupby('month')[['WS100','WD100', 'WS10','WD10']].mean()
+    # yearly and monthly means from one pass, directions as vector means
+    averages = aggregate(era5_data, ['year', 'month'], columns=['WS100','WD100', 'WS10','WD10'], time='time')
+    yearly_avg = averages['year'][['WS100', 'WS10']]
+    monthly_avg = averages['month']
     return yearly_avg, monthly_avg, overall_avg
 
 def check_data_gaps(era5_data):
+    from availability import analyze_availability, print_availability
     era5_data = era5_data.set_index('time')
-    full_time_range = pd.date_range(start=era5_data.index.min(), end=era5_data.index.max(), freq='h')
-    era5_data = era5_data.reindex(full_time_range)
-    missing_data = era5_data[era5_data.isnull().any(axis=1)]
-    
-    total_expected = len(full_time_range)
-    total_actual = len(era5_data.dropna())
-    availability = (total_actual / total_expected) * 100
-    
-    print(f'Data Availability of the ERA5 data is {availability:.2f}%')
-    if not missing_data.empty:
-        print('Missing time periods are:')
-        print(missing_data.index)
-    else:
-        print('No data gaps are found.')
+    result = analyze_availability(era5_data, freq='h', round_to_bin=False)
+    print_availability(result, 'ERA5')
     
-    return missing_data
+    return result['gaps']
 
 def plot_histogram(era5_data):
     plt.figure(figsize=(10, 5))
@@ -112,8 +111,8 @@ def plot_monthly_average(monthly_avg):
     fig.legend(loc="upper right", bbox_to_anchor=(1,1), bbox_transform=ax1.transAxes)
     plt.show()
 
-def analyze_era5_data(era5_path, start_year, end_year):
-    era5_data = load_era5_data(era5_path, start_year, end_year)
+def analyze_era5_data(era5_path, start_year, end_year, store_path=None):
+    era5_data = load_era5_data(era5_path, start_year, end_year, store_path)
     era5_data = process_era5_data(era5_data)
     
     yearly_avg, monthly_avg, overall_avg = calculate_averages(era5_data)
@@ -132,7 +131,7 @@ def analyze_era5_data(era5_path, start_year, end_year):
 def resample_and_merge_data(df_buoy, df_era5, data_name):
     df_buoy['time'] = pd.to_datetime(df_buoy['time'])
     df_buoy.set_index('time', inplace=True)
-    df_buoy = df_buoy.resample('h').mean()  # Resample the data to hourly frequency
+    df_buoy = resample_mean(df_buoy, 'h')  # Resample the data to hourly frequency, directions as vector means
 
     # Ensure df_era5 has a 'time' column as index
     if 'time' in df_era5.columns:
@@ -157,8 +156,8 @@ def calculate_statistics(df_aligned, data_name):
     results = linregress(valid_data['meas_WS150'], valid_data['era5_WS100'])
     mean_meas_WS = valid_data['meas_WS150'].mean()
     mean_era5_WS = valid_data['era5_WS100'].mean()
-    mean_meas_WD = valid_data['meas_WD150'].mean()
-    mean_era5_WD = valid_data['era5_WD100'].mean()
+    mean_meas_WD = circular_mean(valid_data['meas_WD150'])
+    mean_era5_WD = circular_mean(valid_data['era5_WD100'])
     
     print(f'\n<Statistics for {data_name}>')
     print(f'Correlation coefficient between the measurement and Era5 wind speed: {results.rvalue**2:.3f}')
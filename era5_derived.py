@@ -0,0 +1,109 @@
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+RAD2DEG = np.float32(180 / np.pi)
+
+def wind_levels(columns):
+    # Heights for which both u<h> and v<h> columns exist, e.g. [100, 10]
+    return [int(c[1:]) for c in columns
+            if c.startswith('u') and c[1:].isdigit() and f'v{c[1:]}' in columns]
+
+def _as_float32(values):
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+def _as_datetime64(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]', copy=False)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64, copy=False).view('datetime64[ns]')
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]')
+
+def wind_speed_and_direction(u, v, ws_out=None, wd_out=None):
+    # Meteorological convention: direction the wind is coming from, in degrees [0, 360)
+    n = len(u)
+    ws = np.empty(n, dtype=np.float32) if ws_out is None else ws_out
+    wd = np.empty(n, dtype=np.float32) if wd_out is None else wd_out
+    if ne is not None:
+        ne.evaluate('sqrt(u * u + v * v)', local_dict={'u': u, 'v': v}, out=ws, casting='same_kind')
+        ne.evaluate('arctan2(u, v) * RAD2DEG + 180', local_dict={'u': u, 'v': v, 'RAD2DEG': RAD2DEG},
+                    out=wd, casting='same_kind')
+    else:
+        np.hypot(u, v, out=ws)
+        np.arctan2(u, v, out=wd)
+        np.multiply(wd, RAD2DEG, out=wd)
+        np.add(wd, 180, out=wd)
+    np.mod(wd, 360, out=wd)
+    return ws, wd
+
+def derive_wind_variables(era5_data, heights=None, time_column='Time [UTC]'):
+    # Struct-of-arrays result: {'time', 'year', 'month', 'WS<h>', 'WD<h>'} for every height level
+    if heights is None:
+        heights = wind_levels(list(era5_data.keys()))
+
+    derived = {}
+    if time_column in era5_data:
+        t = _as_datetime64(era5_data[time_column])
+        derived['time'] = t
+        derived['year'] = (t.astype('datetime64[Y]').astype(np.int64) + 1970).astype(np.int16)
+        derived['month'] = (t.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+
+    for h in heights:
+        u = _as_float32(era5_data[f'u{h}'])
+        v = _as_float32(era5_data[f'v{h}'])
+        derived[f'WS{h}'], derived[f'WD{h}'] = wind_speed_and_direction(u, v)
+    return derived
+
+def derived_to_frame(era5_data, derived):
+    # Same columns as era5_analysis.process_era5_data, assembled in a single concat
+    return pd.concat([era5_data.reset_index(drop=True),
+                      pd.DataFrame(derived, copy=False)], axis=1)
+
+def process_era5_data_fast(era5_data, heights=None):
+    derived = derive_wind_variables(era5_data, heights)
+    return derived_to_frame(era5_data, derived)
+
+def _time_and_peak(func, *args, repeat=3):
+    times = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 1e6
+
+def benchmark_process_era5_data(era5_data, repeat=3):
+    from era5_analysis import process_era5_data
+
+    raw = era5_data[[c for c in era5_data.columns if c in ('Time [UTC]', 'u100', 'v100', 'u10', 'v10')]]
+    time_pandas, peak_pandas = _time_and_peak(lambda df: process_era5_data(df.copy()), raw, repeat=repeat)
+    time_kernel, peak_kernel = _time_and_peak(derive_wind_variables, raw, repeat=repeat)
+
+    reference = process_era5_data(raw.copy())
+    derived = derive_wind_variables(raw)
+    max_ws_diff = max(np.nanmax(np.abs(reference[c].to_numpy() - derived[c])) for c in ('WS100', 'WS10'))
+    wd_diff = [np.abs((reference[c].to_numpy() - derived[c] + 180) % 360 - 180) for c in ('WD100', 'WD10')]
+    max_wd_diff = max(np.nanmax(d) for d in wd_diff)
+
+    print(f'Rows: {len(raw)}, numexpr: {ne is not None}')
+    print(f'process_era5_data:     {time_pandas * 1e3:.1f} ms, peak allocation {peak_pandas:.1f} MB')
+    print(f'derive_wind_variables: {time_kernel * 1e3:.1f} ms, peak allocation {peak_kernel:.1f} MB')
+    print(f'Max. deviation: {max_ws_diff:.2e} m/s, {max_wd_diff:.2e} degrees')
+
+    return {
+        'time_process_era5_data': time_pandas,
+        'time_derive_wind_variables': time_kernel,
+        'peak_MB_process_era5_data': peak_pandas,
+        'peak_MB_derive_wind_variables': peak_kernel,
+        'max_ws_difference': max_ws_diff,
+        'max_wd_difference': max_wd_diff,
+    }
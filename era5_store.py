@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+ERA5_PREFIX = 'ERA5_N-9_'
+ERA5_TIME_COLUMN = 'Time [UTC]'
+ERA5_WIND_COLUMNS = ['u100', 'v100', 'u10', 'v10']
+MANIFEST_NAME = 'manifest.json'
+
+def era5_source_files(path):
+    # {year: filename} for all ERA5 csv files in the reanalysis directory
+    files = {}
+    for file in os.listdir(path):
+        if file.startswith(ERA5_PREFIX) and file.endswith('.csv'):
+            files[int(file.split('_')[-1].split('.')[0])] = file
+    return dict(sorted(files.items()))
+
+def file_hash(filepath, block_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def partition_path(store_path, year):
+    return os.path.join(store_path, f'year={year}', 'part.parquet')
+
+def read_manifest(store_path):
+    manifest_file = os.path.join(store_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+def write_manifest(store_path, manifest):
+    manifest_file = os.path.join(store_path, MANIFEST_NAME)
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def read_era5_csv(filepath):
+    dtypes = {col: np.float32 for col in ERA5_WIND_COLUMNS}
+    df = pd.read_csv(filepath, dtype=dtypes)
+    # Store timestamps as int64 nanoseconds since epoch, parsed only once at ingestion
+    time = pd.to_datetime(df.pop(ERA5_TIME_COLUMN)).to_numpy(dtype='datetime64[ns]')
+    df.insert(0, 'time', time.view(np.int64))
+    return df
+
+def is_stale(source_file, entry):
+    # Cheap check on size/mtime first, the content hash only decides if those changed
+    if entry is None:
+        return True, None
+    stat = os.stat(source_file)
+    if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+        return False, None
+    sha = file_hash(source_file)
+    return sha != entry['sha1'], sha
+
+def ingest_era5_data(path, store_path, start_year=None, end_year=None, force=False):
+    # Convert the ERA5 csv files into a year-partitioned parquet store, re-ingesting changed files only
+    os.makedirs(store_path, exist_ok=True)
+    manifest = read_manifest(store_path)
+    ingested = []
+
+    for year, file in era5_source_files(path).items():
+        if (start_year is not None and year < start_year) or (end_year is not None and year > end_year):
+            continue
+        source_file = os.path.join(path, file)
+        key = str(year)
+        stale, sha = is_stale(source_file, manifest.get(key))
+        if not os.path.exists(partition_path(store_path, year)):
+            stale = True
+
+        stat = os.stat(source_file)
+        if stale or force:
+            df = read_era5_csv(source_file)
+            target = partition_path(store_path, year)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            df.to_parquet(target, index=False)
+            ingested.append(year)
+        elif sha is None:
+            continue
+
+        # Touched but unchanged files only get their size/mtime refreshed
+        manifest[key] = {
+            'source': file,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': sha if sha is not None else file_hash(source_file),
+        }
+
+    write_manifest(store_path, manifest)
+    if ingested:
+        print(f'Ingested ERA5 years into {store_path}: {ingested}')
+    return ingested
+
+def load_era5_store(path, store_path, start_year, end_year, columns=None, auto_ingest=True):
+    # Read only the partitions of start_year..end_year and only the requested columns
+    if auto_ingest:
+        ingest_era5_data(path, store_path, start_year, end_year)
+
+    read_columns = None if columns is None else ['time'] + [c for c in columns if c != 'time']
+    years = [year for year in sorted(int(k) for k in read_manifest(store_path))
+             if start_year <= year <= end_year]
+    era5_data_list = [pd.read_parquet(partition_path(store_path, year), columns=read_columns) for year in years]
+    era5_data = pd.concat(era5_data_list, ignore_index=True)
+
+    time = era5_data.pop('time').to_numpy(dtype=np.int64).view('datetime64[ns]')
+    era5_data.insert(0, ERA5_TIME_COLUMN, time)
+    return era5_data
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import pandas as pd
+
+CACHE_DIR = 'foxes_cache'
+MAX_CACHE_SIZE = 2e9  # bytes kept on disk before the least recently used entries are evicted
+MODEL_KEYS = ('TType', 'rotor_model', 'wake_models', 'partial_wakes')
+
+def _frame_hash(h, df):
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(repr(list(df.columns)).encode())
+
+def states_fingerprint(States):
+    # Hash of the states data and its column mapping; None for states not backed by a DataFrame
+    data = getattr(States, 'data_source', None)
+    if not isinstance(data, pd.DataFrame):
+        return None
+    h = hashlib.sha1(type(States).__name__.encode())
+    _frame_hash(h, data)
+    for attr in ('var2col', 'fixed_vars', 'ovars'):
+        h.update(repr(getattr(States, attr, None)).encode())
+    return h.hexdigest()
+
+def cache_key(layout, States, Parameters):
+    # Content address of a farm calculation; chunking and runners do not change the results
+    states_hash = states_fingerprint(States)
+    if states_hash is None:
+        return None
+    h = hashlib.sha1(states_hash.encode())
+    _frame_hash(h, layout)
+    h.update(json.dumps({key: Parameters.get(key) for key in MODEL_KEYS}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def entry_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{key}.nc')
+
+def load_farm_results(key, cache_dir=CACHE_DIR):
+    import xarray as xr
+
+    path = entry_path(key, cache_dir)
+    if key is None or not os.path.exists(path):
+        return None
+    with xr.open_dataset(path) as ds:
+        farm_results = ds.load()
+    os.utime(path)  # last use for the eviction order
+    return farm_results
+
+def save_farm_results(key, farm_results, metadata=None, cache_dir=CACHE_DIR, max_size=MAX_CACHE_SIZE):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = entry_path(key, cache_dir)
+    farm_results.to_netcdf(path + '.tmp', format='NETCDF4')
+    os.replace(path + '.tmp', path)
+    with open(os.path.join(cache_dir, f'{key}.json'), 'w') as f:
+        json.dump({**(metadata or {}), 'created': time.strftime('%Y-%m-%d %H:%M:%S')}, f, default=str)
+    evict(max_size, cache_dir)
+
+def list_entries(cache_dir=CACHE_DIR):
+    rows = []
+    if os.path.isdir(cache_dir):
+        for file in os.listdir(cache_dir):
+            if not file.endswith('.nc'):
+                continue
+            key = file[:-3]
+            stat = os.stat(os.path.join(cache_dir, file))
+            meta_file = os.path.join(cache_dir, f'{key}.json')
+            metadata = {}
+            if os.path.exists(meta_file):
+                with open(meta_file) as f:
+                    metadata = json.load(f)
+            rows.append({'key': key, 'size [MB]': stat.st_size / 1e6,
+                         'last used': pd.Timestamp(stat.st_mtime, unit='s').floor('s'), **metadata})
+    entries = pd.DataFrame(rows, columns=['key', 'size [MB]', 'last used'] if not rows else None)
+    return entries.sort_values('last used', ascending=False).reset_index(drop=True)
+
+def remove_entry(key, cache_dir=CACHE_DIR):
+    for suffix in ('.nc', '.json'):
+        path = os.path.join(cache_dir, key + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+def evict(max_size=MAX_CACHE_SIZE, cache_dir=CACHE_DIR):
+    # Drop the least recently used entries until the cache fits into max_size bytes
+    entries = list_entries(cache_dir)
+    total = entries['size [MB]'].sum() * 1e6
+    removed = []
+    for key, size in zip(entries['key'][::-1], entries['size [MB]'][::-1]):
+        if total <= max_size:
+            break
+        remove_entry(key, cache_dir)
+        total -= size * 1e6
+        removed.append(key)
+    return removed
+
+def purge(keys=None, cache_dir=CACHE_DIR):
+    keys = list_entries(cache_dir)['key'] if keys is None else keys
+    for key in keys:
+        remove_entry(key, cache_dir)
+    return list(keys)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect and clean the foxes farm results cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list the cached farm results')
+    purge_parser = commands.add_parser('purge', help='remove cached farm results')
+    purge_parser.add_argument('keys', nargs='*', help='keys (or key prefixes) to remove, all entries if none are given')
+    purge_parser.add_argument('--max-size', type=float, help='only evict least recently used entries beyond this size [MB]')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        entries = list_entries(args.cache_dir)
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(entries if not entries.empty else f'No cached farm results in {args.cache_dir}')
+        print(f"Total {entries['size [MB]'].sum():.1f} MB")
+    elif args.max_size is not None:
+        removed = evict(args.max_size * 1e6, args.cache_dir)
+        print(f'Evicted {len(removed)} entries')
+    else:
+        keys = None
+        if args.keys:
+            keys = [key for key in list_entries(args.cache_dir)['key'] if any(key.startswith(k) for k in args.keys)]
+        removed = purge(keys, args.cache_dir)
+        print(f'Removed {len(removed)} entries')
@@ -0,0 +1,77 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from circular import sector_index
+from wind_rose import wind_rose_table
+
+def _xy(layout):
+    return layout[['x', 'y']].to_numpy(dtype=np.float64)
+
+def nearest_cluster_turbine(cluster_df, external_df):
+    # Distance [m] and bearing [deg] of every external turbine seen from its nearest cluster turbine
+    cluster_xy = _xy(cluster_df)
+    external_xy = _xy(external_df)
+    distance, nearest = cKDTree(cluster_xy).query(external_xy)
+    dx, dy = (external_xy - cluster_xy[nearest]).T
+    bearing = np.mod(np.degrees(np.arctan2(dx, dy)), 360)
+    return distance, bearing
+
+def influence_radius(wd=None, n_sectors=12, min_radius=15000, max_radius=50000):
+    # Radius per direction sector. A turbine upstream in sector s only wakes the cluster when the wind
+    # blows from s, so the radius scales from min_radius to max_radius with the sector frequency.
+    # Without wind directions the radius is max_radius in every direction.
+    if wd is None:
+        return np.full(n_sectors, float(max_radius))
+    wd = np.asarray(wd, dtype=np.float64)
+    frequency = wind_rose_table(np.ones_like(wd), wd, n_sectors=n_sectors)['counts'].sum(axis=1)
+    return min_radius + (max_radius - min_radius) * frequency / frequency.max()
+
+def prune_external_farms(cluster_df, external_df, radius=50000, wd=None, n_sectors=12, min_radius=15000):
+    # External turbines within the (direction dependent) influence radius of the cluster.
+    # radius: scalar [m], an array of n_sectors radii, or the maximum radius when wd is given.
+    distance, bearing = nearest_cluster_turbine(cluster_df, external_df)
+    if wd is not None:
+        radii = influence_radius(wd, n_sectors, min_radius, radius)
+    else:
+        radii = np.broadcast_to(np.asarray(radius, dtype=np.float64), (n_sectors,))
+    keep = distance <= radii[sector_index(bearing, len(radii))]
+
+    pruned = external_df[keep].reset_index(drop=True)
+    report = {
+        'external turbines': len(external_df),
+        'kept turbines': int(keep.sum()),
+        'dropped turbines': int((~keep).sum()),
+        'max kept distance [km]': distance[keep].max() / 1000 if keep.any() else np.nan,
+    }
+    print(f"Pruned external farms: kept {report['kept turbines']} of {report['external turbines']} turbines")
+    return pruned, keep, report
+
+def compare_pruning(cluster_df, external_df, States, Parameters, radius=50000, wd=None, n_sectors=12, min_radius=15000):
+    # Yield of the cluster with all external farms vs with the pruned external farms
+    from foxes_analysis import Foxes_Farm_Power
+
+    pruned_df, _, report = prune_external_farms(cluster_df, external_df, radius, wd, n_sectors, min_radius)
+    n_cluster = len(cluster_df)
+    layouts = {
+        'all external': pd.concat([cluster_df, external_df], ignore_index=True),
+        'pruned external': pd.concat([cluster_df, pruned_df], ignore_index=True),
+    }
+
+    rows = {}
+    for label, layout in layouts.items():
+        start = time.perf_counter()
+        _, turbine_results = Foxes_Farm_Power((layout, label), States, Parameters, plot=False)
+        # the cluster turbines come first in the combined layout
+        rows[label] = {
+            'Simulated turbines': len(layout),
+            'Cluster yield [TWh]': turbine_results['YLD'].iloc[:n_cluster].sum() / 1000,
+            'Runtime [s]': time.perf_counter() - start,
+        }
+
+    results = pd.DataFrame(rows).T
+    reference = results.loc['all external', 'Cluster yield [TWh]']
+    results['Yield error [%]'] = 100 * (results['Cluster yield [TWh]'] - reference) / reference
+    print(results)
+    return results, report
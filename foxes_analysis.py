@@ -3,6 +3,8 @@ import foxes
 import foxes.variables as FV
 import foxes.constants as FC
 import os
+import hashlib
+from collections import OrderedDict
 
 def load_layouts(areas):
     layout_paths = [f"NoWake_Layout_{area}.csv" for area in areas]
@@ -24,6 +26,28 @@ def load_turbine_layouts(turbines_area_of_interest_path, areas):
     
     return Turb_dfs
 
+def farm_tag(filename):
+    # 'layout-N-9.1.geom.csv' -> 'N-9.1'
+    name = os.path.basename(filename)
+    for suffix in ('.csv', '.geom'):
+        name = name[:-len(suffix)] if name.endswith(suffix) else name
+    return name[len('layout-'):] if name.startswith('layout-') else name
+
+def combine_layouts(layouts):
+    # layouts: {farm tag: layout DataFrame}. The combined layout carries the farm tag and a stable
+    # turbine_id (the row, i.e. the foxes turbine index), which compute_farm_power copies into the results.
+    combined = pd.concat(layouts, names=['farm', None]).reset_index(level='farm').reset_index(drop=True)
+    combined['turbine_id'] = combined.index
+    return combined
+
+def farm_yields(turbine_results):
+    # Yield and turbine count of every tagged farm in one groupby
+    grouped = turbine_results.groupby('farm', sort=False)
+    return pd.DataFrame({
+        'Turbines': grouped.size(),
+        'Farm yield [TWh]': grouped['YLD'].sum() / 1000,
+    })
+
 def create_states(data_2023):
     return foxes.input.states.Timeseries(
         data_source=data_2023,
@@ -32,19 +56,74 @@ def create_states(data_2023):
         fixed_vars={FV.RHO: 1.225, FV.TI: 0.05},
     )
 
-def compute_farm_results(geo_cluster_turb_df, states, parameters):
-    result_all_farms = Foxes_Farm_Power(geo_cluster_turb_df, states, parameters)
+def create_states_from_wind_rose(wind_rose_df):
+    # Weighted (ws, wd) bins from wind_rose.wind_rose_frame instead of the full timeseries
+    return foxes.input.states.StatesTable(
+        data_source=wind_rose_df,
+        output_vars=[FV.WS, FV.WD, FV.TI, FV.RHO],
+        var2col={FV.WS: "ws", FV.WD: "wd", FV.WEIGHT: "weight"},
+        fixed_vars={FV.RHO: 1.225, FV.TI: 0.05},
+    )
+
+def create_reduced_states(data, ws_step=0.5, n_sectors=36, ti_col=None, ti_step=0.01,
+                          ws_col="long-term_WS150", wd_col="long-term_WD150"):
+    # Weighted wind rose states instead of one state per timestamp, see wind_rose.reduce_timeseries
+    from wind_rose import reduce_timeseries
+    ti = None if ti_col is None else data[ti_col]
+    reduced = reduce_timeseries(data[ws_col], data[wd_col], ti, ws_bin=ws_step, n_sectors=n_sectors, ti_bin=ti_step)
+
+    var2col = {FV.WS: "ws", FV.WD: "wd", FV.WEIGHT: "weight"}
+    fixed_vars = {FV.RHO: 1.225, FV.TI: 0.05}
+    if ti_col is not None:
+        var2col[FV.TI] = "ti"
+        del fixed_vars[FV.TI]
+
+    print(f"Reduced {len(data)} states to {len(reduced)} wind rose states")
+    states = foxes.input.states.StatesTable(
+        data_source=reduced,
+        output_vars=[FV.WS, FV.WD, FV.TI, FV.RHO],
+        var2col=var2col,
+        fixed_vars=fixed_vars,
+    )
+    return states, reduced
+
+def compare_state_reduction(Farm_Name, data, Parameters, ws_step=0.5, n_sectors=36, ti_col=None, plot=False):
+    # Accuracy report: full timeseries vs reduced wind rose states for the same farm and models
+    import time
+
+    start = time.perf_counter()
+    full_results, full_turbines = Foxes_Farm_Power(Farm_Name, create_states(data), Parameters, plot)
+    time_full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    states, reduced = create_reduced_states(data, ws_step, n_sectors, ti_col)
+    reduced_results, reduced_turbines = Foxes_Farm_Power(Farm_Name, states, Parameters, plot)
+    time_reduced = time.perf_counter() - start
+
+    report = pd.concat([full_results, reduced_results], keys=["timeseries", "wind rose"]).droplevel(1)
+    report["States"] = [len(data), len(reduced)]
+    report["Runtime [s]"] = [time_full, time_reduced]
+    yld_full = full_results["Annual farm yield [TWh]"].iloc[0]
+    report["Yield deviation [%]"] = 100 * (report["Annual farm yield [TWh]"] - yld_full) / yld_full
+    turbine_deviation = 100 * (reduced_turbines[FV.YLD] - full_turbines[FV.YLD]) / full_turbines[FV.YLD]
+    report["Max. turbine yield deviation [%]"] = [0.0, turbine_deviation.abs().max()]
+
+    print(report)
+    return report
+
+def compute_farm_results(geo_cluster_turb_df, states, parameters, plot=True):
+    result_all_farms = Foxes_Farm_Power(geo_cluster_turb_df, states, parameters, plot)
     all_results_inter_wakes = result_all_farms[0]
     turb_results_inter_wakes = result_all_farms[1]
     return all_results_inter_wakes, turb_results_inter_wakes
 
-def compute_farm_results_10(Turb_dfs, states, parameters):
+def compute_farm_results_10(Turb_dfs, states, parameters, plot=True):
     Farm_Results = []
     for Farm in Turb_dfs:
-        Farm_Results.append(Foxes_Farm_Power(Farm, states, parameters))
+        Farm_Results.append(Foxes_Farm_Power(Farm, states, parameters, plot))
     return Farm_Results
 
-def analyze_farm_yield(data_2023, areas, wake_model="Bastankhah2014_linear"):
+def analyze_farm_yield(data_2023, areas, wake_model="Bastankhah2014_linear", plot=True):
     geo_cluster_turb_df = load_layouts(areas)
     states = create_states(data_2023)
     
@@ -55,30 +134,135 @@ def analyze_farm_yield(data_2023, areas, wake_model="Bastankhah2014_linear"):
         "partial_wakes": None,
     }
     
-    all_results, turb_results = compute_farm_results(geo_cluster_turb_df, states, parameters)
+    all_results, turb_results = compute_farm_results(geo_cluster_turb_df, states, parameters, plot)
     
     print(f'Summary Results: {all_results}')
     all_results.to_csv(f'yield_N9-1-3_internal_wakes_{wake_model}.csv')
     
     return all_results, turb_results
 
-def Foxes_Farm_Power(Farm_Name, States, Parameters):
-    import matplotlib.pyplot as plt
-    
+FARM_CACHE_SIZE = 8  # number of wind farms (with their model books) kept alive
+_farm_registry = OrderedDict()
+
+def layout_fingerprint(layout, turbine_models):
+    # Content hash of the turbine positions/columns and the turbine models, independent of the DataFrame object
+    h = hashlib.sha1(pd.util.hash_pandas_object(layout, index=False).to_numpy().tobytes())
+    h.update(repr(list(layout.columns)).encode())
+    h.update(repr(list(turbine_models)).encode())
+    return h.hexdigest()
+
+def get_wind_farm(layout, TType, max_size=FARM_CACHE_SIZE):
+    # WindFarm and ModelBook built once per layout fingerprint and reused across wake models, states and
+    # clusters; the least recently used entries are dropped beyond max_size
+    turbine_models = ["kTI_02", TType]
+    key = layout_fingerprint(layout, turbine_models)
+    if key in _farm_registry:
+        _farm_registry.move_to_end(key)
+        return _farm_registry[key]
+
+    farm = foxes.WindFarm(name="my_farm")
+    foxes.input.farm_layout.add_from_df(farm, layout, turbine_models=turbine_models, verbosity=0)
+    entry = {'fingerprint': key, 'farm': farm, 'mbook': foxes.ModelBook()}
+    _farm_registry[key] = entry
+    while len(_farm_registry) > max_size:
+        _farm_registry.popitem(last=False)
+    return entry
+
+def clear_farm_registry():
+    _farm_registry.clear()
+
+def rotor_points(rotor_model):
+    # Rotor points from the foxes model name: 'centre' -> 1, 'grid16' -> 16, 'level5' -> 5
+    digits = ''.join(c for c in str(rotor_model) if c.isdigit())
+    return int(digits) if digits else 1
+
+def states_size(States):
+    data = getattr(States, 'data_source', None)
+    if isinstance(data, pd.DataFrame):
+        return len(data)
+    return States.size() if States.initialized else None
+
+def available_memory():
+    # Available RAM in bytes, psutil if installed, otherwise the free physical pages.
+    # None where neither works (os.sysconf is missing on Windows, SC_AVPHYS_PAGES on macOS)
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def plan_chunks(n_states, n_turbines, rotor_model="centre", n_vars=30, n_points=None, memory=None,
+                n_workers=None, memory_fraction=0.5, overhead=4, min_chunk=50, chunks_per_worker=4, verbose=True):
+    # State (and point) chunk sizes for Downwind. One state of a chunk holds n_vars float64 values for
+    # every rotor point of every turbine, times an overhead factor for the wake and rotor temporaries.
+    # The memory budget is shared by the workers, and the states are split so that every worker gets
+    # a few chunks; min_chunk keeps the scheduler overhead small for short timeseries.
+    n_rpoints = rotor_points(rotor_model)
+    memory = available_memory() if memory is None else memory
+    if memory is None:
+        raise ValueError('Available memory unknown on this platform, install psutil or pass memory=')
+    n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+    budget = memory * memory_fraction / n_workers
+
+    bytes_per_state = 8 * n_vars * n_turbines * n_rpoints * overhead
+    chunk_memory = max(int(budget // bytes_per_state), 1)
+    chunk_parallel = -(-n_states // (n_workers * chunks_per_worker))
+    chunk_states = min(max(chunk_parallel, min_chunk), chunk_memory, n_states)
+    chunk_states = max(chunk_states, 1)
+    n_chunks = -(-n_states // chunk_states)
+
+    chunks = {FC.STATE: chunk_states}
+    chunk_points = None
+    if n_points is not None:
+        # Point evaluations: the same budget for chunk_states x chunk_points values
+        chunk_points = max(min(int(budget // (8 * n_vars * overhead * chunk_states)), n_points), 1)
+        chunks[FC.POINT] = chunk_points
+
+    peak = min(n_workers, n_chunks) * chunk_states * bytes_per_state + 8 * n_vars * n_states * n_turbines
+    report = {
+        'states': n_states,
+        'turbines': n_turbines,
+        'rotor points': n_rpoints,
+        'variables': n_vars,
+        'workers': n_workers,
+        'memory available [GB]': memory / 1e9,
+        'state chunk': chunk_states,
+        'point chunk': chunk_points,
+        'chunks': n_chunks,
+        'expected peak memory [GB]': peak / 1e9,
+        'memory limited': chunk_memory < max(chunk_parallel, min_chunk),
+    }
+    if verbose:
+        print(pd.Series(report, name='chunk plan').to_string())
+    return chunks, report
+
+def plan_farm_chunks(Farm_Name, States, Parameters, **kwargs):
+    # Dry run for the inputs of Foxes_Farm_Power: prints the chunk plan and expected peak memory
+    return plan_chunks(states_size(States), len(Farm_Name[0]), Parameters['rotor_model'], **kwargs)
+
+def resolve_chunks(chunks, States, n_turbines, rotor_model):
+    # Parameters['chunks']: 'auto' (default) plans from the problem size, a dict is used as given
+    if chunks != 'auto':
+        return chunks
+    n_states = states_size(States)
+    if n_states is None or available_memory() is None:
+        return {FC.STATE: 100}
+    return plan_chunks(n_states, n_turbines, rotor_model, verbose=False)[0]
+
+def compute_farm_power(Farm_Name, States, Parameters, runner=None, cache_dir=None):
+    # Pure computation, no figures: returns farm, algorithm, raw farm results and the summaries.
+    # runner: an already opened foxes runner to reuse, otherwise a DaskRunner is opened for this run
+    # cache_dir: farm results are stored there keyed by layout, models and states, and reloaded on a hit
     Farm = Farm_Name[0]
     Name = Farm_Name[1]
     
-    # Create Wind Farm
-    farm = foxes.WindFarm(name="my_farm")
-
-    # Add Turbine
-    foxes.input.farm_layout.add_from_df(farm, Farm, turbine_models=["kTI_02", Parameters['TType']], verbosity=0)
-
-    # Plot with foxes
-    ax = foxes.output.FarmLayoutOutput(farm).get_figure(figsize=(4, 4))
-    plt.show()
-
-    mbook = foxes.ModelBook()
+    # Wind farm and model book from the registry, only built for unseen layouts
+    registered = get_wind_farm(Farm, Parameters['TType'])
+    farm = registered['farm']
 
     # Configure the Downwind algorithm
     algo = foxes.algorithms.Downwind(
@@ -87,27 +271,40 @@ def Foxes_Farm_Power(Farm_Name, States, Parameters):
         rotor_model=Parameters['rotor_model'],
         wake_models=Parameters['wake_models'],
         partial_wakes=Parameters['partial_wakes'],
-        chunks={FC.STATE: 100},
+        chunks=resolve_chunks(Parameters.get('chunks', 'auto'), States, len(Farm), Parameters['rotor_model']),
+        mbook=registered['mbook'],
         verbosity=0,
     )
 
-    # Calculate the results
-    print(f"Calculating wind farm power for {Name} for Wake Model: {Parameters['wake_models']}:")
-    with foxes.utils.runners.DaskRunner() as runner:
-        farm_results = runner.run(algo.calc_farm)
+    key = farm_results = None
+    if cache_dir is not None:
+        import farm_cache
+        key = farm_cache.cache_key(Farm, States, Parameters)
+        farm_results = farm_cache.load_farm_results(key, cache_dir)
+
+    if farm_results is not None:
+        # the yield evaluation needs the turbine types of the algorithm; finalize again as calc_farm would,
+        # since the models are shared with later runs through the registry
+        print(f"Loaded wind farm results for {Name} for Wake Model: {Parameters['wake_models']} from cache {key[:12]}")
+        algo.initialize()
+        algo.finalize()
+    else:
+        # Calculate the results
+        print(f"Calculating wind farm power for {Name} for Wake Model: {Parameters['wake_models']}:")
+        if runner is None:
+            with foxes.utils.runners.DaskRunner() as runner:
+                farm_results = runner.run(algo.calc_farm)
+        else:
+            farm_results = runner.run(algo.calc_farm)
+        if key is not None:
+            metadata = {'name': Name, 'turbines': len(Farm), 'states': states_size(States),
+                        **{k: Parameters.get(k) for k in farm_cache.MODEL_KEYS}}
+            farm_cache.save_farm_results(key, farm_results, metadata, cache_dir)
         
     # Process Output
     o = foxes.output.FarmResultsEval(farm_results)
     o.add_efficiency()
 
-    # Print Mean REWS + Mean efficiency
-    fig, axs = plt.subplots(1, 2, figsize=(16, 19))
-    layout_output = foxes.output.FarmLayoutOutput(farm, farm_results)
-    layout_output.get_figure(fig=fig, ax=axs[0], color_by="mean_REWS", title="Mean REWS [m/s]", s=150, annotate=1)
-    layout_output.get_figure(fig=fig, ax=axs[1], color_by="mean_EFF", title="Mean efficiency [%]", s=150, annotate=0)
-    plt.show()
-   
-
     P0 = o.calc_mean_farm_power(ambient=True)
     P = o.calc_mean_farm_power()
     
@@ -123,8 +320,111 @@ def Foxes_Farm_Power(Farm_Name, States, Parameters):
     turbine_df1 = o.reduce_states({FV.REWS: "mean", FV.P: "mean", FV.X:'mean', FV.Y: 'mean'})
     turbine_df2 = o.calc_turbine_yield(algo, annual=True)
     turbine_df = pd.concat([turbine_df1, turbine_df2], axis=1)
+    # Results are in layout row order, so tags from combine_layouts are carried over by position
+    for column in ('farm', 'turbine_id'):
+        if column in Farm.columns:
+            turbine_df[column] = Farm[column].to_numpy()
+
+    return {
+        'name': Name,
+        'farm': farm,
+        'algo': algo,
+        'farm_results': farm_results,
+        'summary': Results,
+        'turbines': turbine_df,
+    }
+
+def plot_farm_layout(result):
+    import matplotlib.pyplot as plt
+    # Plot with foxes
+    ax = foxes.output.FarmLayoutOutput(result['farm']).get_figure(figsize=(4, 4))
+    plt.show()
+
+def plot_farm_results(result):
+    import matplotlib.pyplot as plt
+    # Print Mean REWS + Mean efficiency
+    fig, axs = plt.subplots(1, 2, figsize=(16, 19))
+    layout_output = foxes.output.FarmLayoutOutput(result['farm'], result['farm_results'])
+    layout_output.get_figure(fig=fig, ax=axs[0], color_by="mean_REWS", title="Mean REWS [m/s]", s=150, annotate=1)
+    layout_output.get_figure(fig=fig, ax=axs[1], color_by="mean_EFF", title="Mean efficiency [%]", s=150, annotate=0)
+    plt.show()
+
+PLOT_HOOKS = [plot_farm_layout, plot_farm_results]
+
+def Foxes_Farm_Power(Farm_Name, States, Parameters, plot=True, hooks=None, runner=None, cache_dir=None):
+    # hooks: post-processing callables taking the compute_farm_power result, the figures by default
+    result = compute_farm_power(Farm_Name, States, Parameters, runner, cache_dir)
+    if hooks is None:
+        hooks = PLOT_HOOKS if plot else []
+    for hook in hooks:
+        hook(result)
+    return result['summary'], result['turbines']
+
+SWEEP_KEYS = ['Layout', 'Wake model', 'Rotor model', 'Partial wakes']
 
-    return Results, turbine_df
+def read_sweep_results(results_file):
+    if not os.path.exists(results_file):
+        return pd.DataFrame(columns=SWEEP_KEYS)
+    # keep 'None' partial wakes as a string key
+    return pd.read_csv(results_file, keep_default_na=False, dtype={key: str for key in SWEEP_KEYS})
+
+def _sweep_row(layout, States, wake_model, rotor_model, pw, TType, runner):
+    import time
+
+    Parameters = {
+        'TType': TType,
+        'rotor_model': rotor_model,
+        'wake_models': [wake_model],
+        'partial_wakes': pw,
+    }
+    start = time.perf_counter()
+    result = compute_farm_power(layout, States, Parameters, runner)
+    row = result['summary'].reset_index(drop=True)
+    for column, value in zip(SWEEP_KEYS, (layout[1], wake_model, rotor_model, str(pw))):
+        row.insert(SWEEP_KEYS.index(column), column, value)
+    row['Runtime [s]'] = time.perf_counter() - start
+    return row
+
+def _sweep_task(args):
+    # One combination in a pool worker; its chunks run single-threaded, the pool provides the parallelism
+    with foxes.utils.runners.DaskRunner(scheduler='single-threaded', progress_bar=False, verbosity=0) as runner:
+        return _sweep_row(*args, runner)
+
+def _append_sweep_row(row, results_file):
+    row.to_csv(results_file, mode='a', header=not os.path.exists(results_file), index=False)
+
+def run_wake_model_sweep(layouts, States, wake_models, rotor_models=("centre",), partial_wakes=(None,),
+                         TType="IEA15MW", results_file='yield_wake_model_sweep.csv', scheduler=None, n_workers=None):
+    # layouts: list of (DataFrame, name) as for Foxes_Farm_Power. The combinations run concurrently on one
+    # process pool of n_workers (all cores by default) that lives for the whole sweep; n_workers=1 runs them
+    # one after another on a single DaskRunner(scheduler) instead. Every result is appended to results_file
+    # as soon as it is done and combinations already in the file are skipped.
+    from itertools import product
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    done = read_sweep_results(results_file)
+    done_keys = set(map(tuple, done[SWEEP_KEYS].to_numpy()))
+    combinations = list(product(layouts, wake_models, rotor_models, partial_wakes))
+    tasks = [(layout, States, wm, rm, pw, TType) for layout, wm, rm, pw in combinations
+             if (layout[1], wm, rm, str(pw)) not in done_keys]
+    print(f'Wake model sweep: {len(tasks)} of {len(combinations)} combinations to run, '
+          f'{len(combinations) - len(tasks)} found in {results_file}')
+
+    if n_workers == 1 or len(tasks) == 1:
+        with foxes.utils.runners.DaskRunner(scheduler=scheduler) as runner:
+            for task in tasks:
+                _append_sweep_row(_sweep_row(*task, runner), results_file)
+    elif tasks:
+        n_workers = min(n_workers or os.cpu_count() or 1, len(tasks))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_sweep_task, task) for task in tasks]
+            for future in as_completed(futures):
+                _append_sweep_row(future.result(), results_file)
+
+    results = read_sweep_results(results_file)
+    requested = {(layout[1], wm, rm, str(pw)) for layout, wm, rm, pw in combinations}
+    keep = [key in requested for key in map(tuple, results[SWEEP_KEYS].to_numpy())]
+    return results[keep].drop_duplicates(SWEEP_KEYS, keep='last').reset_index(drop=True)
 
 def compare_yield_scenarios(all_results_inter_wakes, N9_farm_yield):
     total_farmyield_nowakes = pd.read_csv('total_farmyield_nowakes.csv')
@@ -148,23 +448,29 @@ def compare_yield_scenarios(all_results_inter_wakes, N9_farm_yield):
 
     return results
 
-def analyze_farm_yield_with_external_effects(df_month_mean, areas):
+def analyze_farm_yield_with_external_effects(df_month_mean, areas, plot=True, prune_radius=None, wd=None):
     # Paths
     turbines_area_of_interest_path = 'data/turbine-info/coordinates/area_of_interest/'
     external_farms_path = 'data/turbine-info/coordinates/existing_planned/'
 
     # Read internal turbine layout files
     internal_files = os.listdir(turbines_area_of_interest_path)
-    Turb_dfs = [pd.read_csv(os.path.join(turbines_area_of_interest_path, file)) for file in internal_files]
-    Cluster_Turb_df = pd.concat(Turb_dfs, ignore_index=True)
+    Turb_dfs = {farm_tag(file): pd.read_csv(os.path.join(turbines_area_of_interest_path, file)) for file in internal_files}
+    Cluster_Turb_df = combine_layouts(Turb_dfs)
 
     # Read external turbine layout files
     external_files = os.listdir(external_farms_path)
-    external_dfs = [pd.read_csv(os.path.join(external_farms_path, file)) for file in external_files]
-    external_combined_df = pd.concat(external_dfs, ignore_index=True)
+    external_dfs = {farm_tag(file): pd.read_csv(os.path.join(external_farms_path, file)) for file in external_files}
+    external_combined_df = combine_layouts(external_dfs)
+
+    # Only simulate the external turbines within the influence radius of the cluster
+    if prune_radius is not None:
+        from farm_pruning import prune_external_farms
+        external_combined_df, _, _ = prune_external_farms(Cluster_Turb_df, external_combined_df, prune_radius, wd)
 
     # Combine internal and external layouts for wake effect calculation
     combined_df = pd.concat([Cluster_Turb_df, external_combined_df], ignore_index=True)
+    combined_df['turbine_id'] = combined_df.index
     Combined_Turb_df = (combined_df, "Combined_Cluster")
 
     # Define States
@@ -184,12 +490,11 @@ def analyze_farm_yield_with_external_effects(df_month_mean, areas):
     }
 
     # Calculate the farm results with wake effects
-    combined_results = Foxes_Farm_Power(Combined_Turb_df, States, Parameters)
+    combined_results = Foxes_Farm_Power(Combined_Turb_df, States, Parameters, plot)
     
     # Extract the results for the farm of interest (Cluster_Turb_df)
     summary_results, turbine_results = combined_results
-    matched_turbines = turbine_results.merge(Cluster_Turb_df, left_on=['X', 'Y'], right_on=['x', 'y'])
-    matched_turbines.drop(['x', 'y'], axis=1, inplace=True)
+    matched_turbines = turbine_results[turbine_results['farm'].isin(Turb_dfs)]
 
     N9_farm_yield = (matched_turbines['YLD'].sum()) / 1000  # TWh 
 
@@ -206,16 +511,16 @@ def load_internal_and_external_layouts(turbines_area_of_interest_path, external_
     # Read internal turbine layout files
     internal_files = os.listdir(turbines_area_of_interest_path)
     Turb_dfs = [pd.read_csv(os.path.join(turbines_area_of_interest_path, file)) for file in internal_files]
+    internal_tags = [farm_tag(file) for file in internal_files]
 
     # Read external turbine layout files
     external_files = os.listdir(external_farms_path)
-    external_dfs = [pd.read_csv(os.path.join(external_farms_path, file)) for file in external_files]
-    external_combined_df = pd.concat(external_dfs, ignore_index=True)
+    external_dfs = {farm_tag(file): pd.read_csv(os.path.join(external_farms_path, file)) for file in external_files}
 
     # Combine internal and external layouts for wake effect calculation
     Combined_Turb_dfs = []
-    for i, Turb_df in enumerate(Turb_dfs):
-        combined_df = pd.concat([Turb_df, external_combined_df], ignore_index=True)
+    for i, (tag, Turb_df) in enumerate(zip(internal_tags, Turb_dfs)):
+        combined_df = combine_layouts({tag: Turb_df, **external_dfs})
         Combined_Turb_dfs.append((combined_df, f"Combined_Cluster{i+1}"))
 
     return Turb_dfs, Combined_Turb_dfs
@@ -228,14 +533,14 @@ def create_states_from_monthly_mean(df_month_mean):
         fixed_vars={FV.RHO: 1.225, FV.TI: 0.05},
     )
 
-def calculate_farm_results_with_wake_effects(Combined_Turb_dfs, States, Parameters):
+def calculate_farm_results_with_wake_effects(Combined_Turb_dfs, States, Parameters, plot=True):
     combined_results = []
     for Combined_Turb_df in Combined_Turb_dfs:
-        result = Foxes_Farm_Power(Combined_Turb_df, States, Parameters)
+        result = Foxes_Farm_Power(Combined_Turb_df, States, Parameters, plot)
         combined_results.append(result)
     return combined_results
 
-def analyze_farm_yield_with_external_effects_v2(df_month_mean, turbines_area_of_interest_path, external_farms_path):
+def analyze_farm_yield_with_external_effects_v2(df_month_mean, turbines_area_of_interest_path, external_farms_path, plot=True):
     Turb_dfs, Combined_Turb_dfs = load_internal_and_external_layouts(turbines_area_of_interest_path, external_farms_path)
     
     States = create_states_from_monthly_mean(df_month_mean)
@@ -247,13 +552,14 @@ def analyze_farm_yield_with_external_effects_v2(df_month_mean, turbines_area_of_
         'partial_wakes': None,
     }
 
-    combined_results = calculate_farm_results_with_wake_effects(Combined_Turb_dfs, States, Parameters)
+    combined_results = calculate_farm_results_with_wake_effects(Combined_Turb_dfs, States, Parameters, plot)
 
     # Process results for each cluster
     cluster_results = []
     for i, (summary_results, turbine_results) in enumerate(combined_results):
-        matched_turbines = turbine_results.merge(Turb_dfs[i], left_on=['X', 'Y'], right_on=['x', 'y'])
-        matched_turbines = matched_turbines.drop(['x', 'y'], axis=1)
+        # the cluster is the first farm of its combined layout
+        cluster_tag = Combined_Turb_dfs[i][0]['farm'].iloc[0]
+        matched_turbines = turbine_results[turbine_results['farm'] == cluster_tag]
         
         N9_farm_yield = (matched_turbines['YLD'].sum()) / 1000  # TWh
 
@@ -261,7 +567,74 @@ def analyze_farm_yield_with_external_effects_v2(df_month_mean, turbines_area_of_
             'Cluster': f'N9_{i+1}',
             'Summary': summary_results,
             'Turbines': matched_turbines,
-            'Farm Yield': N9_farm_yield
+            'Farm Yield': N9_farm_yield,
+            'Farm Yields': farm_yields(turbine_results),
         })
 
-    return cluster_results
\ No newline at end of file
+    return cluster_results
+
+def ambient_turbine_yield(result):
+    # Annual yield per turbine without any wakes [GWh], in layout order
+    o = foxes.output.FarmResultsEval(result['farm_results'])
+    return o.calc_turbine_yield(result['algo'], annual=True, ambient=True).iloc[:, 0].to_numpy()
+
+def analyze_cluster_study(df_month_mean, turbines_area_of_interest_path, external_farms_path, Parameters=None,
+                          plot=False, leave_one_out=False, prune_radius=None):
+    # All sub-clusters and the external farms in one simulation instead of one run per sub-cluster.
+    # A second run of the sub-clusters alone (no external farms, a few hundred turbines) separates the
+    # internal wake losses from the losses induced by the external farms.
+    internal_files = os.listdir(turbines_area_of_interest_path)
+    internal_dfs = {farm_tag(file): pd.read_csv(os.path.join(turbines_area_of_interest_path, file)) for file in internal_files}
+    external_files = os.listdir(external_farms_path)
+    external_dfs = {farm_tag(file): pd.read_csv(os.path.join(external_farms_path, file)) for file in external_files}
+    tags = sorted(internal_dfs)
+
+    Cluster_Turb_df = combine_layouts({tag: internal_dfs[tag] for tag in tags})
+    external_df = combine_layouts(external_dfs)
+    if prune_radius is not None:
+        from farm_pruning import prune_external_farms
+        external_df, _, _ = prune_external_farms(Cluster_Turb_df, external_df, prune_radius)
+    union_df = pd.concat([Cluster_Turb_df, external_df], ignore_index=True)
+    union_df['turbine_id'] = union_df.index
+
+    States = create_states_from_monthly_mean(df_month_mean)
+    if Parameters is None:
+        Parameters = {
+            'TType': "IEA15MW",
+            'rotor_model': "centre",
+            'wake_models': ["Bastankhah2014_linear"],
+            'partial_wakes': None,
+        }
+
+    union = compute_farm_power((union_df, "N9 Cluster + external"), States, Parameters)
+    cluster_only = compute_farm_power((Cluster_Turb_df, "N9 Cluster"), States, Parameters)
+    if plot:
+        for hook in PLOT_HOOKS:
+            hook(union)
+
+    # Ambient yields do not depend on the other turbines, so the small run provides them for every study
+    cluster_farm = Cluster_Turb_df['farm'].to_numpy()
+    ambient = pd.Series(ambient_turbine_yield(cluster_only)).groupby(cluster_farm).sum() / 1000
+    union_cluster = union['turbines'].iloc[:len(Cluster_Turb_df)]
+
+    study = pd.DataFrame({
+        'Turbines': pd.Series(cluster_farm).value_counts(),
+        'Ambient yield [TWh]': ambient,
+        'Internal wakes yield [TWh]': cluster_only['turbines'].groupby('farm')['YLD'].sum() / 1000,
+        'External wakes yield [TWh]': union_cluster.groupby('farm')['YLD'].sum() / 1000,
+    }).loc[tags]
+    study['Internal wake loss [%]'] = 100 * (1 - study['Internal wakes yield [TWh]'] / study['Ambient yield [TWh]'])
+    study['External wake loss [%]'] = 100 * (study['Internal wakes yield [TWh]'] - study['External wakes yield [TWh]']) / study['Ambient yield [TWh]']
+
+    if leave_one_out:
+        # Union without one sub-cluster: the yield the other sub-clusters gain when it is not built
+        for tag in tags:
+            result = compute_farm_power((union_df[union_df['farm'] != tag], f"N9 Cluster without {tag}"), States, Parameters)
+            others = result['turbines']['farm'].isin(tags)
+            others_yield = result['turbines'].loc[others, 'YLD'].sum() / 1000
+            study.loc[tag, 'Others yield without it [TWh]'] = others_yield
+            study.loc[tag, 'Loss caused on others [TWh]'] = others_yield - study['External wakes yield [TWh]'].drop(tag).sum()
+
+    study.index.name = 'Cluster'
+    print(study)
+    return study, union['turbines']
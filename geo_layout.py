@@ -1,7 +1,6 @@
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import foxes
 import foxes.opt.problems.layout.geom_layouts as grg
 from iwopy.interfaces.pymoo import Optimizer_pymoo
@@ -17,7 +16,7 @@ def set_boundary(site_shp, Areas, N):
         ]
     return Area_specs
 
-def NoWake_Layout(Place,Parameters):
+def NoWake_Layout(Place,Parameters, plot=True):
     # No influenz from Wind conditions, just geometric Data
 
     # Farm layout turbine positioning problems. (No Wake)
@@ -49,11 +48,12 @@ def NoWake_Layout(Place,Parameters):
     problem.add_constraint(grg.Boundary(problem))  # very importen, by my experience
     
     problem.initialize()
-    problem.get_fig()     # plot the Problem (is kind of the boundary)
-    plt.show()
+    if plot:
+        import matplotlib.pyplot as plt
+        problem.get_fig()     # plot the Problem (is kind of the boundary)
+        plt.show()
     
     # define the Solver
-    print("new test3")
     solver = Optimizer_pymoo(
         problem,
         problem_pars=dict(vectorize=True),
@@ -80,8 +80,10 @@ def NoWake_Layout(Place,Parameters):
 
 
     xy, valid = results.problem_results
-    problem.get_fig(xy, valid, title=name)
-    plt.show()
+    if plot:
+        import matplotlib.pyplot as plt
+        problem.get_fig(xy, valid, title=name)
+        plt.show()
 
     #The list of turbine coordinates is now stored as a numpy array under `xy`:
     # print(xy)
@@ -92,8 +94,10 @@ def NoWake_Layout(Place,Parameters):
   
     File_Name = "NoWake_Layout_" + name + ".csv"
     df.to_csv(File_Name, header=True, index=False)
+    return df
     
 def plot_optimized_areas(Areas, site_shp, Layout_Path):
+    import matplotlib.pyplot as plt
     Layout_dfs = [pd.read_csv(file) for file in Layout_Path]
 
     Visualizer = []
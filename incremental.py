@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from availability import analyze_availability, print_availability
+from data_analysis import deduplicate
+from interpolation import interpolate_arrays
+
+STATE_NAME = 'watermark.json'
+
+def read_state(store_path):
+    state_file = os.path.join(store_path, STATE_NAME)
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+def write_state(store_path, state):
+    os.makedirs(store_path, exist_ok=True)
+    state_file = os.path.join(store_path, STATE_NAME)
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1, default=str)
+    os.replace(state_file + '.tmp', state_file)
+
+def partition_path(store_path, month):
+    return os.path.join(store_path, f'month={month}', 'part.parquet')
+
+def append_to_store(store_path, df):
+    # Monthly partitions; only the partitions touched by the new rows are rewritten
+    if df.empty:
+        return []
+    months = df.index.strftime('%Y-%m')
+    written = []
+    for month, df_month in df.groupby(months):
+        target = partition_path(store_path, month)
+        if os.path.exists(target):
+            existing = pd.read_parquet(target)
+            df_month = df_month.combine_first(existing)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        df_month.sort_index().to_parquet(target)
+        written.append(month)
+    return written
+
+def read_store(store_path, start=None, end=None, columns=None):
+    # Same frame as data_loading.read_LT_data_to_df, restricted to the partitions in [start, end]
+    if not os.path.isdir(store_path):
+        raise FileNotFoundError(store_path)
+    months = sorted(d.split('=', 1)[1] for d in os.listdir(store_path) if d.startswith('month='))
+    if start is not None:
+        months = [m for m in months if m >= pd.Timestamp(start).strftime('%Y-%m')]
+    if end is not None:
+        months = [m for m in months if m <= pd.Timestamp(end).strftime('%Y-%m')]
+    df = pd.concat([pd.read_parquet(partition_path(store_path, m), columns=columns) for m in months])
+    df.index.name = 'time'
+    return df.loc[start:end]
+
+def new_rows(df, watermark):
+    if watermark is None:
+        return df
+    return df[df.index > pd.Timestamp(watermark)]
+
+def update_interpolated_store(store_path, buoys, heights=(140, 200), target_height=150, freq='10min'):
+    # buoys: {'6': df_buoy_6, '2': df_buoy_2} with the columns of data_loading.create_buoy_dataframes.
+    # Only rows newer than each buoy's watermark are checked, filled, interpolated and appended.
+    state = read_state(store_path)
+    buoy_states = state.setdefault('buoys', {})
+    height1, height2 = heights
+    outputs = []
+
+    for name, df_buoy in buoys.items():
+        buoy_state = buoy_states.setdefault(name, {'watermark': None, 'last_row': None})
+        df_new = df_buoy.copy()
+        df_new.index = df_new.index.floor('s').round(freq)
+        df_new = new_rows(df_new, buoy_state['watermark'])
+        if df_new.empty:
+            print(f'Buoy {name}: no new data after {buoy_state["watermark"]}')
+            continue
+
+        print(f'Buoy {name}: {len(df_new)} new rows')
+        print_availability(analyze_availability(df_new, freq, round_to_bin=False), f'new buoy {name}')
+        df_new, _, _ = deduplicate(df_new.sort_index(), key='time')
+
+        # Forward fill continues from the last row of the previous update
+        if buoy_state['last_row'] is not None:
+            carry = pd.DataFrame([buoy_state['last_row']], index=[pd.Timestamp(buoy_state['watermark'])])
+            df_new = pd.concat([carry[df_new.columns], df_new]).ffill().iloc[1:]
+        else:
+            df_new = df_new.ffill()
+
+        out = pd.DataFrame({
+            f'ws{name}_{target_height}m': interpolate_arrays(
+                df_new[f'wind_speed_{height1}m'], df_new[f'wind_speed_{height2}m'], height1, height2, target_height),
+            f'wd{name}_{target_height}m': interpolate_arrays(
+                df_new[f'wind_direction_{height1}m'], df_new[f'wind_direction_{height2}m'], height1, height2, target_height,
+                circular=True),
+        })
+        outputs.append(out)
+
+        buoy_state['watermark'] = df_new.index.max().isoformat()
+        buoy_state['last_row'] = {col: float(val) for col, val in df_new.iloc[-1].items()}
+
+    if outputs:
+        df_out = pd.concat(outputs, axis=1, sort=True)
+        df_out.index.name = 'time'
+        written = append_to_store(store_path, df_out)
+        print(f'Updated partitions: {written}')
+    write_state(store_path, state)
+    return state
+
+def update_longterm_store(store_path, era5_selected, slope=None, intercept=None, dir_offset=None):
+    # era5_selected: era5_WS100/era5_WD100 indexed by time. The MCP coefficients are stored with the
+    # output on the first call and reused for every later update.
+    state = read_state(store_path)
+    mcp = state.setdefault('mcp', {})
+    for key, value in (('slope', slope), ('intercept', intercept), ('dir_offset', dir_offset)):
+        if value is not None:
+            mcp[key] = float(value)
+    if not {'slope', 'intercept', 'dir_offset'} <= set(mcp):
+        raise ValueError('slope, intercept and dir_offset are required on the first update')
+
+    df_new = new_rows(era5_selected.sort_index(), state.get('watermark'))
+    if df_new.empty:
+        print(f"No new ERA5 data after {state.get('watermark')}")
+        return state
+
+    df_out = pd.DataFrame({
+        'era5_WS100': df_new['era5_WS100'],
+        'era5_WD100': df_new['era5_WD100'],
+        'long-term_WS150': mcp['slope'] * df_new['era5_WS100'].to_numpy() + mcp['intercept'],
+        'long-term_WD150': np.mod(df_new['era5_WD100'].to_numpy() + mcp['dir_offset'], 360),
+    }, index=df_new.index)
+    df_out.index.name = 'time'
+
+    written = append_to_store(store_path, df_out)
+    print(f'Long-term corrected {len(df_out)} new rows, updated partitions: {written}')
+    state['watermark'] = df_out.index.max().isoformat()
+    write_state(store_path, state)
+    return state
@@ -1,10 +1,92 @@
+import numpy as np
 import pandas as pd
 
-def interpolate_arrays(array1, array2, height1, height2, target_height):
+from circular import wrap_difference
+
+def interpolate_arrays(array1, array2, height1, height2, target_height, circular=False):
 
     # Calculate the interpolation factor
     factor = (target_height - height1) / (height2 - height1) #factor = (x-x1)/(x2-x1)
+    if circular:
+        # Directions: interpolate along the shorter arc, e.g. 350 and 10 degrees give 0, not 180
+        return (array1 + factor * wrap_difference(array2, array1)) % 360
     # Perform the interpolation
     interpolated_array = array1 + factor * (array2 - array1) #formular: y1 + factor *(y2 - y1)
 
-    return interpolated_array
\ No newline at end of file
+    return interpolated_array
+
+def hub_heights_from_power_curves(power_curves_path):
+    # e.g. IEA-15MW-D240-H150.csv -> 150
+    import os
+    import re
+    heights = {}
+    for file in sorted(os.listdir(power_curves_path)):
+        match = re.search(r'-H(\d+)\.csv$', file)
+        if match:
+            heights[file[:-4]] = int(match.group(1))
+    return heights
+
+def _bracketing_pairs(heights, target_heights):
+    # Lower level index of the pair used for every target; outer pairs extrapolate
+    lower = np.searchsorted(heights, target_heights, side='right') - 1
+    return np.clip(lower, 0, len(heights) - 2)
+
+def interpolate_profile(profile, heights, target_heights, method='linear', circular=False, chunk_size=500000,
+                        dtype=np.float32):
+    # profile: (time, height) block -> (time, target) block for all target heights in one call.
+    # method: 'linear' in z, 'log' (log-law, linear in ln z) or 'power' (power-law, ln y linear in ln z).
+    # circular=True interpolates the wrapped difference, for wind directions in degrees.
+    if method not in ('linear', 'log', 'power'):
+        raise ValueError(f"method must be 'linear', 'log' or 'power', got {method!r}")
+    profile = np.asarray(profile)
+    heights = np.asarray(heights, dtype=np.float64)
+    target_heights = np.atleast_1d(np.asarray(target_heights, dtype=np.float64))
+    order = np.argsort(heights)
+    heights, profile = heights[order], profile[:, order]
+    if len(heights) < 2:
+        raise ValueError('At least two measurement heights are needed')
+
+    lower = _bracketing_pairs(heights, target_heights)
+    z1, z2 = heights[lower], heights[lower + 1]
+    if method == 'linear':
+        factor = (target_heights - z1) / (z2 - z1)
+    else:
+        factor = np.log(target_heights / z1) / np.log(z2 / z1)
+
+    n_time = profile.shape[0]
+    out = np.empty((n_time, len(target_heights)), dtype=dtype)
+    for start in range(0, n_time, chunk_size):
+        stop = min(start + chunk_size, n_time)
+        y1 = profile[start:stop, lower].astype(np.float64)
+        y2 = profile[start:stop, lower + 1].astype(np.float64)
+        if circular:
+            out[start:stop] = (y1 + factor * wrap_difference(y2, y1)) % 360
+        elif method == 'power':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                power = y1 * (y2 / y1) ** factor
+            # Non-positive speeds have no power-law fit, fall back to log-law there
+            out[start:stop] = np.where((y1 > 0) & (y2 > 0), power, y1 + factor * (y2 - y1))
+        else:
+            out[start:stop] = y1 + factor * (y2 - y1)
+    return out
+
+def interpolate_lidar_profiles(df, target_heights, method='linear', speed_prefix='wind_speed',
+                               direction_prefix='wind_direction', chunk_size=500000):
+    # Uses every '<prefix>_<h>m' column of a buoy frame, returns '<prefix>_<target>m' columns
+    import re
+
+    def levels(prefix):
+        pattern = re.compile(rf'^{prefix}_(\d+(?:\.\d+)?)m$')
+        found = {float(m.group(1)): c for c in df.columns for m in [pattern.match(c)] if m}
+        return dict(sorted(found.items()))
+
+    columns = {}
+    for prefix, circular in ((speed_prefix, False), (direction_prefix, True)):
+        found = levels(prefix)
+        if len(found) < 2:
+            continue
+        block = interpolate_profile(df[list(found.values())].to_numpy(), list(found), target_heights,
+                                    method=method, circular=circular, chunk_size=chunk_size)
+        for i, height in enumerate(np.atleast_1d(target_heights)):
+            columns[f'{prefix}_{height:g}m'] = block[:, i]
+    return pd.DataFrame(columns, index=df.index)
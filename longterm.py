@@ -1,11 +1,8 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error, mean_squared_error
-from scipy.stats import linregress
-from windrose import WindroseAxes
+
+from circular import circular_mean, wrap_difference
+from aggregation import aggregate
 
 def prepare_data_for_MCP(df_aligned):
     X = pd.DataFrame(df_aligned['era5_WS100'])
@@ -16,45 +13,91 @@ def prepare_data_for_MCP(df_aligned):
     return x, y
 
 def perform_linear_mcp(X_train, y_train, X_test):
+    from sklearn.linear_model import LinearRegression
     lin_model = LinearRegression()
     lin_model.fit(X_train, y_train)
     y_pred = lin_model.predict(X_test)
     return lin_model, y_pred
 
-def evaluate_mcp_model(y_test, y_pred, data_name):
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    results = linregress(y_test.values.flatten(), y_pred.flatten())
-    correlation = results.rvalue**2
+def linear_mcp(df_aligned, test_size=0.3, random_state=42):
+    # Compute-only linear MCP on NumPy arrays: the same split as train_test_split(test_size, random_state)
+    # and the same least-squares fit as LinearRegression, without sklearn
+    from mcp_methods import train_test_indices, fit_linear, predict_linear
+
+    x, y = prepare_data_for_MCP(df_aligned)
+    x = x.to_numpy(dtype=np.float64).ravel()
+    y = y.to_numpy(dtype=np.float64).ravel()
+    # one NaN in the sums would make the whole fit NaN
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if len(x) < 2:
+        raise ValueError('No concurrent era5_WS100 and meas_WS150 values to fit the MCP on')
+    train, test = train_test_indices(len(x), test_size, random_state)
+    fit = fit_linear(x[train], y[train])
+    y_test = y[test]
+    y_pred = predict_linear(fit, x[test])
+    error = y_pred - y_test
+
+    return {
+        'slope': fit['slope'],
+        'intercept': fit['intercept'],
+        'mae': np.mean(np.abs(error)),
+        'rmse': np.sqrt(np.mean(error ** 2)),
+        'r2': np.corrcoef(y_test, y_pred)[0, 1] ** 2,
+        'n_train': len(train),
+        'n_test': len(test),
+        'y_test': y_test,
+        'y_pred': y_pred,
+    }
+
+def evaluate_mcp_model(y_test, y_pred, data_name, plot=True):
+    y_test = np.asarray(y_test, dtype=np.float64).ravel()
+    y_pred = np.asarray(y_pred, dtype=np.float64).ravel()
+    mae = np.mean(np.abs(y_test - y_pred))
+    rmse = np.sqrt(np.mean((y_test - y_pred) ** 2))
+    correlation = np.corrcoef(y_test, y_pred)[0, 1] ** 2
    
     print(f'<Evaluation of MCP model for {data_name}>')
     print(f'Mean absolute error: {mae:.3f}')
     print(f'Root mean squared error: {rmse:.3f}')
     print(f'Correlation coefficient: {correlation:.3f}')
 
-    plt.figure(figsize=(12, 8))
-    plt.plot(y_test, y_pred, '.', label='Data points')
-    plt.xlabel(f'Test - Measured wind speed of {data_name} [m/s]')
-    plt.ylabel(f'Test - Predicted wind speed of {data_name} [m/s]')
-    plt.title(f'Scatter plot of wind speed - Predicted {data_name} test data vs Actual {data_name} test data')
-    reg = LinearRegression().fit(y_test, y_pred)
-    plt.plot(y_test, reg.predict(y_test), color='red', label='Regression Line')
-    plt.legend()
-    plt.show()
-
-def correct_wind_direction(df_aligned, data_name):
-    mean_wind_dir_meas = df_aligned['meas_WD150'].mean()
-    mean_wind_dir_era5 = df_aligned['era5_WD100'].mean()
-    dir_difference = mean_wind_dir_meas - mean_wind_dir_era5
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.figure(figsize=(12, 8))
+        plt.plot(y_test, y_pred, '.', label='Data points')
+        plt.xlabel(f'Test - Measured wind speed of {data_name} [m/s]')
+        plt.ylabel(f'Test - Predicted wind speed of {data_name} [m/s]')
+        plt.title(f'Scatter plot of wind speed - Predicted {data_name} test data vs Actual {data_name} test data')
+        slope, intercept = np.polyfit(y_test, y_pred, 1)
+        order = np.argsort(y_test)
+        plt.plot(y_test[order], slope * y_test[order] + intercept, color='red', label='Regression Line')
+        plt.legend()
+        plt.show()
+
+def correct_wind_direction(df_aligned, data_name, plot=True):
+    # Vector means, so that e.g. 350 and 10 degrees average to 0 and not 180
+    mean_wind_dir_meas = circular_mean(df_aligned['meas_WD150'])
+    mean_wind_dir_era5 = circular_mean(df_aligned['era5_WD100'])
+    dir_difference = wrap_difference(mean_wind_dir_meas, mean_wind_dir_era5)
     df_aligned['long-term_WD150'] = (df_aligned['era5_WD100'] + dir_difference) % 360
-    mean_LT_wind_dir = df_aligned['long-term_WD150'].mean()
+    mean_LT_wind_dir = circular_mean(df_aligned['long-term_WD150'])
 
     print(f'<Correction of wind direction for {data_name}>')
     print(f'Mean wind direction of measurement: {mean_wind_dir_meas:.2f} degrees')
     print(f'Mean wind direction of ERA5: {mean_wind_dir_era5:.2f} degrees')
     print(f'Wind directions of ERA 5 are corrected by {dir_difference:.2f} degrees')
     print(f'Mean wind direction of the measurement after the correction is {mean_LT_wind_dir:.2f} degrees')
-    
+
+    if plot:
+        plot_corrected_wind_roses(df_aligned, data_name)
+
+    return df_aligned
+
+def plot_corrected_wind_roses(df_aligned, data_name):
+    import matplotlib.pyplot as plt
+    import windrose  # registers the 'windrose' projection
+
     fig = plt.figure(figsize=(16, 8))
     
     ax1 = fig.add_subplot(1, 2, 1, projection='windrose')
@@ -69,8 +112,6 @@ def correct_wind_direction(df_aligned, data_name):
 
     plt.show()
 
-    return df_aligned
-
 def calculate_mean_wind_speed(predicted_df, orig_meas, corr_meas, data_name):
     mean_wind_speed_orig = predicted_df[orig_meas].mean()
     mean_wind_speed_corr = predicted_df[corr_meas].mean()
@@ -80,6 +121,7 @@ def calculate_mean_wind_speed(predicted_df, orig_meas, corr_meas, data_name):
     print(f'Mean wind speed of the long-term corrected measurement: {mean_wind_speed_corr:.3f} m/s')
 
 def plot_linear_mcp_results(predicted_df, orig_meas, corr_meas, data_name):
+    import matplotlib.pyplot as plt
     print(f'\n<Plotting data for {data_name}>')
 
     plt.figure(figsize=(16, 8))
@@ -120,24 +162,26 @@ def plot_linear_mcp_results(predicted_df, orig_meas, corr_meas, data_name):
 
     plt.show()
 
-def run_lin_mcp_workflow(df_aligned, data_name):
-    x, y = prepare_data_for_MCP(df_aligned)
-    X_train, X_test, y_train, y_test = train_test_split(x, y, test_size=0.3, random_state=42)
-    lin_model, y_pred = perform_linear_mcp(X_train, y_train, X_test)
-    evaluate_mcp_model(y_test, y_pred, data_name)
-    df_aligned['long-term_WS150'] = lin_model.predict(pd.DataFrame(df_aligned[['era5_WS100']]))
-    df_aligned = correct_wind_direction(df_aligned, data_name)
+def run_lin_mcp_workflow(df_aligned, data_name, uncertainty=None, power_curve_data=None, plot=True):
+    # uncertainty: 'bootstrap' or 'kfold' also reports P50/P90 of the long-term mean, see mcp_uncertainty.py
+    # plot=False runs the correction without matplotlib/windrose, e.g. in batch jobs
+    result = linear_mcp(df_aligned)
+    evaluate_mcp_model(result['y_test'], result['y_pred'], data_name, plot)
+    df_aligned['long-term_WS150'] = result['slope'] * df_aligned['era5_WS100'].to_numpy() + result['intercept']
+    df_aligned = correct_wind_direction(df_aligned, data_name, plot)
     calculate_mean_wind_speed(df_aligned, 'meas_WS150', 'long-term_WS150', data_name)
-    plot_linear_mcp_results(df_aligned, 'meas_WS150', 'long-term_WS150', data_name)
+    if uncertainty is not None:
+        from mcp_uncertainty import mcp_uncertainty, print_mcp_uncertainty
+        print_mcp_uncertainty(mcp_uncertainty(df_aligned, power_curve_data, method=uncertainty), data_name)
+    if plot:
+        plot_linear_mcp_results(df_aligned, 'meas_WS150', 'long-term_WS150', data_name)
     return df_aligned
 
 def calc_diurnal_wsand_wd(df):
-        df.index = pd.to_datetime(df.index)
-        df['hour'] = df.index.hour
-        df_diurnal_WSWD = df.groupby('hour').mean()
-        return df_diurnal_WSWD
+        return aggregate(df, ['hour'])['hour']
 
 def plot_dirunal_ws_and_wd(diurnal_index, diurnal_ws, diurnal_wd):
+    import matplotlib.pyplot as plt
     fig, ax1 = plt.subplots(figsize=(12, 6))
     # Plot wind speed histogram on the left y-axis
     ax1.bar(diurnal_index, diurnal_ws, width=0.4, label='Wind Speed 150m (Buoy 6)', color='b', align='center')
@@ -154,7 +198,7 @@ def plot_dirunal_ws_and_wd(diurnal_index, diurnal_ws, diurnal_wd):
     plt.grid(True)
     plt.show()
     
-def calculate_energy_production(windspeed_data, power_curve_data, turbines_N9_1, turbines_N9_2, turbines_N9_3):
+def calculate_energy_production(windspeed_data, power_curve_data, turbines_N9_1, turbines_N9_2, turbines_N9_3, method='quad', fit_method='scipy'):
     from scipy.stats import weibull_min 
     
     T = 8760  # total hours/year [h]
@@ -192,9 +236,20 @@ def calculate_energy_production(windspeed_data, power_curve_data, turbines_N9_1,
     cut_in_ws = cut_in_windspeed(power_curve_data)
     cut_out_ws = cut_out_windspeed(power_curve_data)
     power_curve_func = power_curve_interpolated(power_curve_data)
-    shape, scale = calculate_weibull_fit(windspeed_data)
-
-    APP, error = calculate_APP(shape, scale, power_curve_func, cut_in_ws, cut_out_ws)
+    if fit_method == 'scipy':
+        shape, scale = calculate_weibull_fit(windspeed_data)
+    else:
+        # Closed-form / binned fits, see weibull.py
+        from weibull import fit_weibull
+        fit = fit_weibull(windspeed_data, method=fit_method)
+        shape, scale = fit['shape'][0], fit['scale'][0]
+
+    if method == 'table':
+        # Vectorized grid integration, see aep.py
+        from aep import calculate_app
+        APP, error = calculate_app(shape, scale, power_curve_data)
+    else:
+        APP, error = calculate_APP(shape, scale, power_curve_func, cut_in_ws, cut_out_ws)
     
     total_farm_yield_no_wakes = ((APP/1e9) * 366)
 
@@ -213,6 +268,7 @@ def calculate_energy_production(windspeed_data, power_curve_data, turbines_N9_1,
     return results
 
 def plot_weibull_distribution(windspeed_data, shape, scale):
+    import matplotlib.pyplot as plt
     from scipy.stats import weibull_min
     plt.figure(figsize=(10, 6))
     ws_range = np.linspace(0, max(windspeed_data), 100)
@@ -235,6 +291,7 @@ def save_total_farm_yield(total_farm_yield_no_wakes):
     df.to_csv('total_farmyield_nowakes.csv', index=False)
 
 def plot_power_curve(power_curve_data):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.plot(power_curve_data['ws'], power_curve_data['P'], marker='o', linestyle='-', color='b')
     plt.title('Power Curve')
@@ -0,0 +1,136 @@
+import time
+import numpy as np
+import pandas as pd
+
+from mcp_uncertainty import block_sums, linear_fit_from_sums
+from circular import sector_index
+
+# Every MCP method is a (fit, predict) pair on NumPy arrays:
+#   params = fit(x, y, wd, **options)    x: reference (ERA5) speed, y: measured speed, wd: reference direction
+#   y_pred = predict(params, x, wd)
+
+def _sums(x, y, groups=None, n_groups=1):
+    groups = np.zeros(len(x), dtype=np.int64) if groups is None else groups
+    return block_sums(x, y, groups, n_groups)
+
+def fit_linear(x, y, wd=None):
+    slope, intercept = linear_fit_from_sums(_sums(x, y)[0])
+    return {'slope': slope, 'intercept': intercept}
+
+def predict_linear(params, x, wd=None):
+    return params['slope'] * x + params['intercept']
+
+def fit_variance_ratio(x, y, wd=None):
+    # Keeps the variance of the measurement instead of shrinking it like least squares
+    slope = np.std(y) / np.std(x)
+    return {'slope': slope, 'intercept': np.mean(y) - slope * np.mean(x)}
+
+def fit_sector_linear(x, y, wd, n_sectors=12, min_count=100):
+    # Least squares per direction sector from one bincount pass, the global fit for sparse sectors
+    sums = _sums(x, y, sector_index(wd, n_sectors), n_sectors)
+    slope, intercept = linear_fit_from_sums(sums)
+    global_fit = fit_linear(x, y)
+    sparse = (sums[:, 0] < min_count) | ~np.isfinite(slope)
+    slope[sparse] = global_fit['slope']
+    intercept[sparse] = global_fit['intercept']
+    return {'slope': slope, 'intercept': intercept, 'n_sectors': n_sectors}
+
+def predict_sector_linear(params, x, wd):
+    sector = sector_index(wd, params['n_sectors'])
+    return params['slope'][sector] * x + params['intercept'][sector]
+
+def _matrix_cells(x, wd, n_sectors, ws_bin, n_ws):
+    ws_index = np.minimum((x / ws_bin).astype(np.int64), n_ws - 1)
+    return sector_index(wd, n_sectors) * n_ws + ws_index
+
+def fit_matrix(x, y, wd, n_sectors=12, ws_bin=1.0, min_count=10):
+    # Speed-direction matrix: mean speed-up y - x per (sector, reference speed bin) cell.
+    # Cells with few samples use the mean speed-up of their sector.
+    n_ws = int(np.floor(x.max() / ws_bin)) + 1
+    cells = _matrix_cells(x, wd, n_sectors, ws_bin, n_ws)
+    count = np.bincount(cells, minlength=n_sectors * n_ws).reshape(n_sectors, n_ws)
+    delta_sum = np.bincount(cells, weights=y - x, minlength=n_sectors * n_ws).reshape(n_sectors, n_ws)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = delta_sum / count
+        sector_delta = delta_sum.sum(axis=1) / count.sum(axis=1)
+    sector_delta = np.where(np.isfinite(sector_delta), sector_delta, np.mean(y - x))
+    delta = np.where(count >= min_count, delta, sector_delta[:, None])
+    return {'delta': delta, 'n_sectors': n_sectors, 'ws_bin': ws_bin, 'n_ws': n_ws}
+
+def predict_matrix(params, x, wd):
+    cells = _matrix_cells(x, wd, params['n_sectors'], params['ws_bin'], params['n_ws'])
+    return x + params['delta'].ravel()[cells]
+
+def _gbm_features(x, wd):
+    wd_rad = np.radians(wd)
+    return np.column_stack([x, np.sin(wd_rad), np.cos(wd_rad)])
+
+def fit_gbm(x, y, wd, max_iter=200, random_state=42):
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    model = HistGradientBoostingRegressor(max_iter=max_iter, random_state=random_state)
+    model.fit(_gbm_features(x, wd), y)
+    return {'model': model}
+
+def predict_gbm(params, x, wd):
+    return params['model'].predict(_gbm_features(x, wd))
+
+MCP_METHODS = {
+    'linear': (fit_linear, predict_linear),
+    'variance_ratio': (fit_variance_ratio, predict_linear),
+    'sector_linear': (fit_sector_linear, predict_sector_linear),
+    'matrix': (fit_matrix, predict_matrix),
+    'gbm': (fit_gbm, predict_gbm),
+}
+
+def fit_mcp(method, x, y, wd=None, **options):
+    if method not in MCP_METHODS:
+        raise ValueError(f'Unknown MCP method {method!r}, choose from {list(MCP_METHODS)}')
+    return MCP_METHODS[method][0](x, y, wd, **options)
+
+def predict_mcp(method, params, x, wd=None):
+    return MCP_METHODS[method][1](params, x, wd)
+
+def train_test_indices(n, test_size=0.3, random_state=42):
+    # Same split as sklearn.model_selection.train_test_split(test_size, random_state) on n samples
+    n_test = int(np.ceil(test_size * n))
+    permutation = np.random.RandomState(random_state).permutation(n)
+    return permutation[n_test:], permutation[:n_test]
+
+def mcp_arrays(df_aligned):
+    # (x, y, wd) of the concurrent period and (x, wd) of the full reference period
+    reference = df_aligned[['era5_WS100', 'era5_WD100']].dropna()
+    concurrent = df_aligned.loc[reference.index.intersection(df_aligned['meas_WS150'].dropna().index)]
+    x = concurrent['era5_WS100'].to_numpy(dtype=np.float64)
+    y = concurrent['meas_WS150'].to_numpy(dtype=np.float64)
+    wd = concurrent['era5_WD100'].to_numpy(dtype=np.float64)
+    return (x, y, wd), (reference['era5_WS100'].to_numpy(dtype=np.float64), reference['era5_WD100'].to_numpy(dtype=np.float64))
+
+def evaluate_mcp_methods(df_aligned, methods=None, test_size=0.3, random_state=42, options=None):
+    # Fit every method on the same training split, score on the same test split and predict the full
+    # reference period. options: {method: keyword arguments of its fit function}
+    methods = list(MCP_METHODS) if methods is None else list(methods)
+    options = options or {}
+    (x, y, wd), (x_lt, wd_lt) = mcp_arrays(df_aligned)
+    train, test = train_test_indices(len(x), test_size, random_state)
+
+    rows = {}
+    for method in methods:
+        start = time.perf_counter()
+        params = fit_mcp(method, x[train], y[train], wd[train], **options.get(method, {}))
+        fit_time = time.perf_counter() - start
+        y_pred = predict_mcp(method, params, x[test], wd[test])
+        error = y_pred - y[test]
+        rows[method] = {
+            'MAE [m/s]': np.mean(np.abs(error)),
+            'RMSE [m/s]': np.sqrt(np.mean(error ** 2)),
+            'Bias [m/s]': np.mean(error),
+            'R2': np.corrcoef(y[test], y_pred)[0, 1] ** 2,
+            'Std ratio': np.std(y_pred) / np.std(y[test]),
+            'Long-term mean [m/s]': np.mean(predict_mcp(method, params, x_lt, wd_lt)),
+            'Fit time [s]': fit_time,
+        }
+
+    table = pd.DataFrame(rows).T
+    table.index.name = 'MCP method'
+    return table
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from aep import T, cut_in_out
+
+N_SUMS = 5  # n, sum x, sum y, sum xy, sum x^2
+BATCH_SIZE = 100  # bootstrap replicates per task, fixed so results do not depend on the number of workers
+Z90 = 1.2815515655446004  # standard normal 90 % quantile
+
+def time_blocks(index, block='7D'):
+    # Consecutive block number of every time stamp, blocks of fixed length from the first time stamp
+    t = pd.DatetimeIndex(index).values.astype('datetime64[ns]').view(np.int64)
+    codes = (t - t.min()) // pd.Timedelta(block).value
+    _, codes = np.unique(codes, return_inverse=True)
+    return codes
+
+def block_sums(x, y, blocks, n_blocks=None):
+    # Sufficient statistics of the least-squares fit per block, shape (n_blocks, 5)
+    n_blocks = int(blocks.max()) + 1 if n_blocks is None else n_blocks
+    values = (np.ones_like(x), x, y, x * y, x * x)
+    return np.stack([np.bincount(blocks, weights=v, minlength=n_blocks) for v in values], axis=-1)
+
+def linear_fit_from_sums(sums):
+    # Closed-form least squares y = slope * x + intercept from (..., 5) sums
+    n, sx, sy, sxy, sxx = np.moveaxis(np.asarray(sums, dtype=np.float64), -1, 0)
+    slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+    intercept = (sy - slope * sx) / n
+    return slope, intercept
+
+def _bootstrap_batch(args):
+    sums, n_samples, seed = args
+    rng = np.random.default_rng(seed)
+    n_blocks = len(sums)
+    # Draw n_blocks blocks with replacement: how often each block is used in every replicate
+    draws = rng.integers(0, n_blocks, size=(n_samples, n_blocks))
+    counts = np.zeros((n_samples, n_blocks))
+    np.add.at(counts, (np.arange(n_samples)[:, None], draws), 1)
+    return linear_fit_from_sums(counts @ sums)
+
+def bootstrap_fits(sums, n_samples=500, seed=42, n_workers=None):
+    # Block bootstrap of the MCP regression, replicate batches spread over a process pool
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_samples // BATCH_SIZE))
+    tasks = [(sums, min(BATCH_SIZE, n_samples - i * BATCH_SIZE), s) for i, s in enumerate(seeds)]
+    if n_workers == 1 or len(tasks) <= 1:
+        results = [_bootstrap_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_bootstrap_batch, tasks))
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+def kfold_fits(sums, k=10):
+    # Blocked k-fold: contiguous groups of blocks are left out in turn
+    folds = np.array_split(np.arange(len(sums)), k)
+    total = sums.sum(axis=0)
+    train = np.array([total - sums[fold].sum(axis=0) for fold in folds])
+    return linear_fit_from_sums(train)
+
+def long_term_app(slope, intercept, x_long_term, power_curve_data, ws_bin=0.1):
+    # Annual production of one turbine [kWh] for every fit. The long-term predictions are a linear map of
+    # the ERA5 speeds, so the ERA5 histogram is computed once and only its bin centres are transformed.
+    edges = np.arange(0, x_long_term.max() + 2 * ws_bin, ws_bin)
+    counts, _ = np.histogram(x_long_term, bins=edges)
+    frequency = counts / counts.sum()
+    centres = (edges[:-1] + edges[1:]) / 2
+
+    cut_in, cut_out = cut_in_out(power_curve_data)
+    ws = slope[:, None] * centres[None, :] + intercept[:, None]
+    power = np.interp(ws, power_curve_data['ws'], power_curve_data['P'])
+    power[(ws < cut_in) | (ws > cut_out)] = 0.0
+    return T * power @ frequency
+
+def _fit_quantities(slope, intercept, x_long_term, power_curve_data, n_turbines):
+    samples = pd.DataFrame({
+        'slope': slope,
+        'intercept': intercept,
+        'long-term mean WS150 [m/s]': slope * x_long_term.mean() + intercept,
+    })
+    if power_curve_data is not None:
+        samples['APP one turbine [GWh]'] = long_term_app(slope, intercept, x_long_term, power_curve_data) / 1e6
+        samples[f'AEP {n_turbines} turbines [TWh]'] = samples['APP one turbine [GWh]'] * n_turbines / 1000
+    return samples
+
+def mcp_uncertainty(df_aligned, power_curve_data=None, method='bootstrap', n_samples=500, k=10, block='7D',
+                    n_workers=None, seed=42, n_turbines=366):
+    # Spread of the long-term mean wind speed (and APP) over block bootstrap or blocked k-fold refits of the
+    # linear MCP. Blocks of consecutive time stamps keep the autocorrelated samples together.
+    valid = df_aligned[['era5_WS100', 'meas_WS150']].notna().all(axis=1)
+    concurrent = df_aligned[valid]
+    x = concurrent['era5_WS100'].to_numpy(dtype=np.float64)
+    y = concurrent['meas_WS150'].to_numpy(dtype=np.float64)
+    sums = block_sums(x, y, time_blocks(concurrent.index, block))
+
+    if method == 'bootstrap':
+        slope, intercept = bootstrap_fits(sums, n_samples, seed, n_workers)
+    elif method == 'kfold':
+        slope, intercept = kfold_fits(sums, k)
+    else:
+        raise ValueError(f"Unknown method {method!r}, choose 'bootstrap' or 'kfold'")
+
+    x_long_term = df_aligned['era5_WS100'].dropna().to_numpy(dtype=np.float64)
+    reference_slope, reference_intercept = linear_fit_from_sums(sums.sum(axis=0))
+    samples = _fit_quantities(slope, intercept, x_long_term, power_curve_data, n_turbines)
+    quantities = samples.drop(columns=['slope', 'intercept'])
+
+    # P90: value exceeded with 90 % probability
+    if method == 'bootstrap':
+        summary = pd.DataFrame({
+            'P50': quantities.quantile(0.5),
+            'P90': quantities.quantile(0.1),
+            'std': quantities.std(),
+        })
+    else:
+        # The leave-one-fold-out fits share (k - 1) / k of the data, their spread understates the sampling
+        # error by about sqrt(k - 1): jackknife std, P90 from a normal approximation around the full fit
+        n_folds = len(quantities)
+        std = np.sqrt((n_folds - 1) / n_folds * ((quantities - quantities.mean()) ** 2).sum())
+        full = _fit_quantities(np.array([reference_slope]), np.array([reference_intercept]), x_long_term,
+                               power_curve_data, n_turbines).drop(columns=['slope', 'intercept']).iloc[0]
+        summary = pd.DataFrame({'P50': full, 'P90': full - Z90 * std, 'std': std})
+
+    return {
+        'method': method,
+        'n_blocks': len(sums),
+        'slope': reference_slope,
+        'intercept': reference_intercept,
+        'samples': samples,
+        'summary': summary,
+    }
+
+def print_mcp_uncertainty(result, data_name):
+    print(f"<MCP uncertainty for {data_name}: {result['method']} with {len(result['samples'])} fits over {result['n_blocks']} blocks>")
+    print(f"Full fit: slope {result['slope']:.4f}, intercept {result['intercept']:.4f}")
+    print(result['summary'].round(4))
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+K_MIN, K_MAX = 0.1, 20.0
+
+def group_codes(*keys):
+    # Combine several keys (e.g. sector, month, year) into one integer code per sample.
+    # Returns the codes, the grid shape and the labels of every key.
+    factorized = [pd.factorize(np.asarray(key), sort=True) for key in keys]
+    shape = tuple(len(labels) for _, labels in factorized)
+    key_codes = np.array([codes for codes, _ in factorized])
+    valid = (key_codes >= 0).all(axis=0)
+    codes = np.full(key_codes.shape[1], -1, dtype=np.int64)
+    codes[valid] = np.ravel_multi_index(key_codes[:, valid], shape)
+    return codes, shape, [np.asarray(labels) for _, labels in factorized]
+
+def _prepare(windspeed, groups, n_groups):
+    windspeed = np.asarray(windspeed, dtype=np.float64)
+    groups = np.zeros(len(windspeed), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    valid = np.isfinite(windspeed) & (groups >= 0)
+    windspeed, groups = windspeed[valid], groups[valid]
+    n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+    return windspeed, groups, n_groups
+
+def _group_sums(values, groups, n_groups):
+    return np.bincount(groups, weights=values, minlength=n_groups)
+
+def _bisect(func, n, n_iter=60):
+    # Vectorized bisection on log(k) for functions that change sign once in [K_MIN, K_MAX]
+    lo = np.full(n, np.log(K_MIN))
+    hi = np.full(n, np.log(K_MAX))
+    f_lo = func(np.exp(lo))
+    for _ in range(n_iter):
+        mid = (lo + hi) / 2
+        f_mid = func(np.exp(mid))
+        same = np.sign(f_mid) == np.sign(f_lo)
+        lo = np.where(same, mid, lo)
+        f_lo = np.where(same, f_mid, f_lo)
+        hi = np.where(same, hi, mid)
+    return np.exp((lo + hi) / 2)
+
+def _result(shape, scale, count):
+    # No fit for fewer than two samples, or when the root search ends on a bound (constant speeds,
+    # very high dispersion): those groups get NaN instead of the clamped K_MIN / K_MAX
+    inside = (shape > K_MIN * (1 + 1e-6)) & (shape < K_MAX * (1 - 1e-6))
+    fitted = (count >= 2) & inside & np.isfinite(scale)
+    shape = np.where(fitted, shape, np.nan)
+    scale = np.where(fitted, scale, np.nan)
+    return {'shape': shape, 'scale': scale, 'count': count}
+
+def fit_weibull_moments(windspeed, groups=None, n_groups=None):
+    # Method of moments: k from the coefficient of variation, A from the mean
+    windspeed, groups, n_groups = _prepare(windspeed, groups, n_groups)
+    count = np.bincount(groups, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _group_sums(windspeed, groups, n_groups) / count
+        cv2 = _group_sums(windspeed ** 2, groups, n_groups) / count / mean ** 2 - 1
+
+        def func(k):
+            return np.exp(gammaln(1 + 2 / k) - 2 * gammaln(1 + 1 / k)) - 1 - cv2
+
+        shape = _bisect(func, n_groups)
+        scale = mean / np.exp(gammaln(1 + 1 / shape))
+    return _result(shape, scale, count)
+
+def fit_weibull_wasp(windspeed, groups=None, n_groups=None):
+    # WAsP method: conserve the mean cubed wind speed (energy) and the frequency above the mean
+    windspeed, groups, n_groups = _prepare(windspeed, groups, n_groups)
+    count = np.bincount(groups, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _group_sums(windspeed, groups, n_groups) / count
+        m3 = _group_sums(windspeed ** 3, groups, n_groups) / count
+        p_above = _group_sums((windspeed > mean[groups]).astype(np.float64), groups, n_groups) / count
+
+        def scale_of(k):
+            return np.exp((np.log(m3) - gammaln(1 + 3 / k)) / 3)
+
+        def func(k):
+            return -(mean / scale_of(k)) ** k - np.log(p_above)
+
+        shape = _bisect(func, n_groups)
+        scale = scale_of(shape)
+    return _result(shape, scale, count)
+
+def fit_weibull_histogram(counts, bin_centres, n_iter=50, tol=1e-10, shape0=None):
+    # Maximum likelihood on binned data, Newton iterations for all rows of counts (n_groups, n_bins) at once
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.float64))
+    bin_centres = np.asarray(bin_centres, dtype=np.float64)
+    positive = bin_centres > 0
+    w, log_x = counts[:, positive], np.log(bin_centres[positive])
+    total = w.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_log_x = (w @ log_x) / total
+        if shape0 is None:
+            mean = (w @ bin_centres[positive]) / total
+            std = np.sqrt(np.maximum((w @ bin_centres[positive] ** 2) / total - mean ** 2, 0))
+            shape0 = np.clip((std / mean) ** -1.086, K_MIN, K_MAX)
+        shape = np.where(np.isfinite(shape0), shape0, 2.0)
+
+        for _ in range(n_iter):
+            # Scale x^k by its row maximum to keep the sums finite for large k
+            k_log_x = shape[:, None] * log_x[None, :]
+            x_k = np.exp(k_log_x - k_log_x.max(axis=1, keepdims=True)) * w
+            s0 = x_k.sum(axis=1)
+            s1 = x_k @ log_x
+            s2 = x_k @ log_x ** 2
+            g = s1 / s0 - 1 / shape - mean_log_x
+            dg = (s2 * s0 - s1 ** 2) / s0 ** 2 + 1 / shape ** 2
+            step = np.where(np.isfinite(g / dg), g / dg, 0.0)
+            shape = np.clip(shape - step, K_MIN, K_MAX)
+            if np.all(np.abs(step) < tol):
+                break
+
+        k_log_x = shape[:, None] * log_x[None, :]
+        row_max = k_log_x.max(axis=1)
+        mean_x_k = (np.exp(k_log_x - row_max[:, None]) * w).sum(axis=1) / total
+        scale = np.exp((np.log(mean_x_k) + row_max) / shape)
+    return _result(shape, scale, total)
+
+def fit_weibull_mle_binned(windspeed, groups=None, n_groups=None, bin_width=0.1):
+    # Histogram all groups in one bincount, then Newton MLE on the binned counts
+    windspeed, groups, n_groups = _prepare(windspeed, groups, n_groups)
+    n_bins = int(np.ceil(windspeed.max() / bin_width)) + 1 if len(windspeed) else 1
+    bins = np.minimum((windspeed / bin_width).astype(np.int64), n_bins - 1)
+    counts = np.bincount(groups * n_bins + bins, minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+    bin_centres = (np.arange(n_bins) + 0.5) * bin_width
+    return fit_weibull_histogram(counts, bin_centres)
+
+WEIBULL_FIT_METHODS = {
+    'moments': fit_weibull_moments,
+    'wasp': fit_weibull_wasp,
+    'mle': fit_weibull_mle_binned,
+}
+
+def fit_weibull(windspeed, groups=None, method='mle', n_groups=None, **kwargs):
+    if method not in WEIBULL_FIT_METHODS:
+        raise ValueError(f'Unknown Weibull fit method {method!r}, choose from {list(WEIBULL_FIT_METHODS)}')
+    return WEIBULL_FIT_METHODS[method](windspeed, groups, n_groups, **kwargs)
+
+def fit_weibull_table(windspeed, *keys, method='mle', **kwargs):
+    # Fits per combination of keys, e.g. fit_weibull_table(ws, sector, month, year) -> 12 x 12 x 30 arrays
+    codes, shape, labels = group_codes(*keys)
+    result = fit_weibull(windspeed, codes, method, n_groups=int(np.prod(shape)), **kwargs)
+    return {**{key: value.reshape(shape) for key, value in result.items()}, 'labels': labels}
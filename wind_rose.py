@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from circular import sector_centres, sector_index, grouped_circular_mean
+
+def wind_rose_table(ws, wd, n_sectors=12, ws_bin=1.0, ws_max=None, weights=None):
+    # Joint (sector, wind speed bin) frequency table in one bincount pass
+    ws = np.asarray(ws, dtype=np.float64)
+    wd = np.asarray(wd, dtype=np.float64)
+    valid = np.isfinite(ws) & np.isfinite(wd) & (ws >= 0)
+    ws, wd = ws[valid], wd[valid]
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+
+    ws_max = ws.max() if ws_max is None else ws_max
+    n_ws = int(np.floor(ws_max / ws_bin)) + 1
+    ws_index = np.minimum((ws / ws_bin).astype(np.int64), n_ws - 1)
+    codes = sector_index(wd, n_sectors) * n_ws + ws_index
+    counts = np.bincount(codes, weights=weights, minlength=n_sectors * n_ws).reshape(n_sectors, n_ws)
+
+    return {
+        'counts': counts,
+        'ws_edges': np.arange(n_ws + 1) * ws_bin,
+        'ws_centres': (np.arange(n_ws) + 0.5) * ws_bin,
+        'wd_centres': sector_centres(n_sectors),
+    }
+
+def wind_rose_frame(table, min_weight=0.0):
+    # Long format (ws, wd, weight) of the non-empty bins, weights summing to one
+    counts = table['counts']
+    wd, ws = np.meshgrid(table['wd_centres'], table['ws_centres'], indexing='ij')
+    weight = counts / counts.sum()
+    keep = weight.ravel() > min_weight
+    return pd.DataFrame({
+        'ws': ws.ravel()[keep],
+        'wd': wd.ravel()[keep],
+        'weight': weight.ravel()[keep],
+    })
+
+def reduce_timeseries(ws, wd, ti=None, ws_bin=0.5, n_sectors=36, ti_bin=0.01):
+    # Collapse a (WS, WD[, TI]) timeseries into weighted bins. Each bin is represented by the mean
+    # wind speed (and TI) and the vector mean direction of its members rather than the bin centre.
+    ws = np.asarray(ws, dtype=np.float64)
+    wd = np.asarray(wd, dtype=np.float64)
+    valid = np.isfinite(ws) & np.isfinite(wd)
+    if ti is not None:
+        ti = np.asarray(ti, dtype=np.float64)
+        valid &= np.isfinite(ti)
+        ti = ti[valid]
+    ws, wd = ws[valid], wd[valid]
+
+    n_ws = int(np.floor(ws.max() / ws_bin)) + 1
+    codes = sector_index(wd, n_sectors) * n_ws + np.minimum((ws / ws_bin).astype(np.int64), n_ws - 1)
+    if ti is not None:
+        n_ti = int(np.floor(ti.max() / ti_bin)) + 1
+        codes = codes * n_ti + np.minimum((ti / ti_bin).astype(np.int64), n_ti - 1)
+
+    # Compact the occupied bins so the sums below scale with the data, not the full bin grid
+    _, codes = np.unique(codes, return_inverse=True)
+    count = np.bincount(codes)
+
+    reduced = pd.DataFrame({
+        'ws': np.bincount(codes, weights=ws) / count,
+        'wd': grouped_circular_mean(wd, codes, len(count)),
+    })
+    if ti is not None:
+        reduced['ti'] = np.bincount(codes, weights=ti) / count
+    reduced['weight'] = count / count.sum()
+    reduced['count'] = count
+    return reduced